@@ -0,0 +1,78 @@
+"""
+Check that the fused built-in pass of Replacer gives the same output as the
+separate URL, code block, custom emoji and sound emoji scans, and time both.
+
+Usage: python benchmarks/bench_replacer.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "discord_tts"))
+
+from vv_wrapper.database import Replacer  # noqa: E402
+
+CORPUS = [
+    "おはようございます",
+    "今日の配信はこちら https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://x.com/user/status/1234567890 これ見て",
+    "<https://discord.com/channels/123/456/789>",
+    "リンク2つ https://example.com/a と https://example.com/b",
+    "同じリンク https://example.com/a https://example.com/a",
+    "https://ja.wikipedia.org/wiki/%E6%97%A5%E6%9C%AC 日本語版",
+    "http://localhost:8080/api/v1/users?id=1&name=test",
+    "https://example.com/path_(with)_parens,and,commas!",
+    "http:///broken",
+    "http:// スペース",
+    "<:pepe:123456789012345678> かわいい",
+    "<a:party_blob:987654321098765432><a:party_blob:987654321098765432>",
+    "<:Thinking_Face2:1>?",
+    "<sound:123456789012345678:987654321098765432>",
+    "サウンド<sound:1:2>と絵文字<:ok:3>",
+    "```py\nprint('hello')\n```",
+    "コードです```\nhttps://example.com/in/code\n<:e:1>\n```ここまで",
+    "```a``` と ```b```",
+    "閉じてない ``` ブロック https://example.com",
+    "`inline code` はそのまま",
+    "<@123456789012345678> さん、<#123456789012345678> を見てください",
+    "<t:1700000000:R> に集合",
+    "www.example.com はURLではない",
+    "メールは test@example.com です",
+    "wwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwww",
+    "長文です。" * 40,
+    "https://example.com/" + "a" * 500,
+    "混在 https://a.example/x <:a:1> ```c``` <sound:1:1> 終わり",
+    "",
+]
+
+
+def legacy(text: str) -> str:
+    text = Replacer.replace_urls(text, "URL省略")
+    text = Replacer.replace_code_blocks(text, "コード省略")
+    text = Replacer.replace_custom_emoji(text)
+    return Replacer.replace_sound_moji(text)
+
+
+def fused(text: str) -> str:
+    return Replacer.replace_builtin(text.encode("utf8")).decode("utf8")
+
+
+def main() -> None:
+    mismatches = 0
+    for text in CORPUS:
+        expected, actual = legacy(text), fused(text)
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {text!r}\n  legacy: {expected!r}\n  fused:  {actual!r}")
+    print(f"{len(CORPUS)} messages, {mismatches} mismatches")
+
+    number = 200
+    legacy_time = timeit.timeit(lambda: [legacy(t) for t in CORPUS], number=number) / number
+    fused_time = timeit.timeit(lambda: [fused(t) for t in CORPUS], number=number) / number
+    print(f"legacy: {legacy_time * 1e6:8.1f}us per corpus")
+    print(f"fused:  {fused_time * 1e6:8.1f}us per corpus ({legacy_time / fused_time:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
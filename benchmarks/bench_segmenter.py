@@ -0,0 +1,76 @@
+"""
+Compare the sentence segmenter with the old split on every 、 and 。.
+
+Usage: python benchmarks/bench_segmenter.py [first_size] [chunk_size]
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "discord_tts"))
+
+import segmenter  # noqa: E402
+
+POST_PHONEME_LENGTH = 0.1
+
+CORPUS = [
+    "おはよう",
+    "こんにちは、今日はいい天気ですね。",
+    "それな",
+    "えー、まじで、それは知らなかった、ありがとう",
+    "今日の夜、九時から、いつものメンバーで、ゲームやろうと思うんだけど、来れる人いる？",
+    "了解です。\nあとで確認します。\n",
+    "草",
+    "このURLは、後で見ておいてください。よろしくお願いします。",
+    "昨日の配信見た？最後のところ、めっちゃ面白かったよね、特にあの、ボスを倒すところ。",
+    "、、、",
+    "はい、はい、はい、わかりました、すぐやります、ちょっと待ってください、",
+    "明日は、朝から雨らしいので、傘を持っていったほうがいいと思います。それと、電車が遅れるかもしれないので、早めに出たほうがいいですよ。",
+    "\n\nうん\n\n",
+    "なるほど、確かに、その方法なら、処理が速くなりそうですね、試してみます。",
+    "よろしくお願いします、",
+]
+
+
+def legacy(text: str) -> list[str]:
+    return re.split("[。、\n]", text)
+
+
+def legacy_engine_calls(fragments: list[str]) -> int:
+    """the old converter: audio_query and synthesis for every fragment, empty ones included"""
+    return len(fragments) * 2
+
+
+def engine_calls(fragments: list[str]) -> int:
+    """the current converter: audio_query for every fragment and synthesis for each of its jobs"""
+    jobs = 2 if len(fragments) > 2 else len(fragments)
+    return len(fragments) + jobs
+
+
+def report(name: str, split, calls_of) -> None:
+    fragments = [split(text) for text in CORPUS]
+    count = sum(len(f) for f in fragments)
+    empty = sum(1 for f in fragments for t in f if not t.strip())
+    calls = sum(calls_of(f) for f in fragments)
+    first = sum(len(f[0]) for f in fragments if f) / max(1, sum(1 for f in fragments if f))
+    seconds = timeit.timeit(lambda: [split(text) for text in CORPUS], number=1000) / 1000
+    print(
+        f"{name:>17}: fragments {count:4} (empty {empty:3}) / engine calls {calls:4} / "
+        f"padding {count * POST_PHONEME_LENGTH:5.1f}s / first chunk {first:5.1f} chars / "
+        f"{seconds * 1e6:7.1f}us per corpus"
+    )
+
+
+def main() -> None:
+    first_size = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    chunk_size = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    print(f"{len(CORPUS)} messages, first_size={first_size}, chunk_size={chunk_size}")
+    # the old split with the old converter, then both splits with the current converter
+    report("legacy", legacy, legacy_engine_calls)
+    report("legacy split", legacy, engine_calls)
+    report("segmenter", lambda text: segmenter.segment(text, first_size, chunk_size), engine_calls)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import io
+import wave
+from typing import Optional
+
+import discord
+import numpy as np
+from discord.opus import Encoder
+
+SAMPLING_RATE: int = Encoder.SAMPLING_RATE
+CHANNELS: int = Encoder.CHANNELS
+FRAME_SIZE: int = Encoder.FRAME_SIZE
+
+
+def read_wav(wav: bytes, samples: bool = True) -> tuple[int, int, bytes]:
+    """
+    Read the format and the samples of a 16 bit WAV.
+    :param wav: WAV bytes
+    :param samples: Whether to read the samples, False to only check the header
+    :return: channels, sampling rate and 16 bit little endian samples (empty if not read)
+    :raises ValueError: The WAV is not 16 bit mono or stereo
+    """
+    try:
+        with wave.open(io.BytesIO(wav), "rb") as w:
+            channels = w.getnchannels()
+            width = w.getsampwidth()
+            rate = w.getframerate()
+            frames = w.readframes(w.getnframes()) if samples else b""
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"Invalid WAV: {e}") from e
+    if width != 2 or channels not in (1, 2):
+        raise ValueError(f"Unsupported WAV format: {width * 8}bit {channels}ch")
+    return channels, rate, frames
+
+
+def wav_to_pcm(wav: bytes) -> bytes:
+    """
+    Convert 16 bit WAV to the 48kHz stereo PCM discord sends.
+    Other sampling rates are resampled with linear interpolation and mono is duplicated to both channels.
+    :param wav: WAV bytes
+    :return: 16 bit little endian PCM
+    :raises ValueError: The WAV is not 16 bit mono or stereo
+    """
+    channels, rate, frames = read_wav(wav)
+    if rate == SAMPLING_RATE and channels == CHANNELS:
+        return frames
+
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels)
+    if rate != SAMPLING_RATE and len(samples):
+        count = len(samples) * SAMPLING_RATE // rate
+        positions = np.arange(count) * (rate / SAMPLING_RATE)
+        source = np.arange(len(samples))
+        samples = np.stack([np.interp(positions, source, samples[:, c]) for c in range(channels)], axis=1)
+    if channels == 1:
+        samples = np.repeat(samples, CHANNELS, axis=1)
+    return np.rint(samples).clip(-32768, 32767).astype("<i2").tobytes()
+
+
+def wav_duration(wav: bytes) -> float:
+    """
+    Length of the WAV read from its header.
+    :param wav: WAV bytes
+    :return: seconds, 0.0 if the header is invalid
+    """
+    try:
+        with wave.open(io.BytesIO(wav), "rb") as w:
+            return w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return 0.0
+
+
+class WavSource(discord.AudioSource):
+    """
+    Audio source playing WAV bytes without starting ffmpeg.
+    Only the format is checked when it is created. The WAV is converted to 48kHz stereo PCM
+    on the first read, which runs on the player thread, and the voice client encodes it to Opus.
+    """
+
+    def __init__(self, wav: bytes) -> None:
+        """
+        Check the WAV.
+        :param wav: WAV bytes
+        :raises ValueError: The WAV is not supported
+        """
+        self._pcm: Optional[memoryview] = None
+        read_wav(wav, samples=False)
+        self._wav: bytes = wav
+        self._position: int = 0
+
+    @property
+    def duration(self) -> float:
+        """
+        Length of the audio in seconds
+        :return: seconds
+        """
+        if self._pcm is None:
+            return wav_duration(self._wav)
+        return len(self._pcm) / (SAMPLING_RATE * CHANNELS * 2)
+
+    def read(self) -> bytes:
+        if self._pcm is None:
+            self._pcm = memoryview(wav_to_pcm(self._wav))
+            self._wav = b""
+        frame = self._pcm[self._position:self._position + FRAME_SIZE]
+        self._position += FRAME_SIZE
+        if not frame:
+            return b""
+        if len(frame) < FRAME_SIZE:
+            return bytes(frame) + bytes(FRAME_SIZE - len(frame))
+        return bytes(frame)
+
+    def is_opus(self) -> bool:
+        return False
+
+    def cleanup(self) -> None:
+        if self._pcm is not None:
+            self._pcm.release()
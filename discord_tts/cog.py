@@ -12,12 +12,11 @@ from discord.ext.pages import Paginator, Page
 # from discord.commands import slash_command, SlashCommandGroup, Option
 import voicemanager
 from util import BridgeCtx
-
-styles: dict[str, str] = {}
+from vv_wrapper import database
 
 
 async def style_choices(ctx: discord.AutocompleteContext):
-    return list(styles)
+    return list((await ctx.bot.voice_manager.fetch_speakers()).styles())
 
 
 def list_pagination(regex: dict, simple: dict) -> Paginator:
@@ -90,7 +89,7 @@ class UserCommands(commands.Cog):
             speaker: BridgeOption(str, "話者を変更", autocomplete=style_choices)
     ):
         user_id = ctx.author.id
-        speaker_id = self.vm.speakers.styles().get(speaker)
+        speaker_id = (await self.vm.fetch_speakers()).style_id(speaker)
         if speaker_id is None:
             await ctx.respond("無効な値です")
             return
@@ -157,11 +156,7 @@ class UserCommands(commands.Cog):
     ):
         user_id = ctx.author.id
         setting = self.vm.get_user_setting(user_id)
-        speaker = "不明"
-        for k, v in styles.items():
-            if v == setting.speaker:
-                speaker = k
-                break
+        speaker = (await self.vm.fetch_speakers()).style_name(setting.speaker) or "不明"
 
         if json:
             settings = asdict(setting)
@@ -289,7 +284,7 @@ class GuildCommands(commands.Cog):
             ctx: BridgeCtx,
             speaker: BridgeOption(str, "サーバー標準話者を変更", autocomplete=style_choices)
     ):
-        speaker_id = styles.get(speaker)
+        speaker_id = (await self.vm.fetch_speakers()).style_id(speaker)
         if speaker_id is None:
             await ctx.respond("無効な値です")
             return
@@ -380,6 +375,85 @@ class GuildCommands(commands.Cog):
         self.vm.guild_settings.update(ctx.guild.id, "read_nick", read_nick)
         await ctx.respond(f"ニックネームを読み上げる設定を{read_nick}に変更しました")
 
+    @guild_setting.command(name="change-queue-limit", description="読み上げ待ちメッセージの上限を変更")
+    async def change_queue_limit(
+            self,
+            ctx: BridgeCtx,
+            queue_limit: BridgeOption(int, "読み上げ待ちメッセージの上限(0で無制限)", min_value=0, max_value=200)
+    ):
+        if not (0 <= queue_limit <= 200):
+            await ctx.respond("上限は0から200の間で指定してください")
+            return
+        self.vm.guild_settings.update(ctx.guild.id, "queue_limit", queue_limit)
+        await ctx.respond(f"読み上げ待ちメッセージの上限を{queue_limit}件に変更しました")
+
+    @guild_setting.command(name="change-queue-audio-limit", description="再生待ち音声の上限を変更")
+    async def change_queue_audio_limit(
+            self,
+            ctx: BridgeCtx,
+            queue_audio_limit: BridgeOption(float, "再生待ち音声の上限秒数(0で無制限)", min_value=0.0, max_value=600.0)
+    ):
+        if not (0.0 <= queue_audio_limit <= 600.0):
+            await ctx.respond("上限は0から600秒の間で指定してください")
+            return
+        self.vm.guild_settings.update(ctx.guild.id, "queue_audio_limit", queue_audio_limit)
+        await ctx.respond(f"再生待ち音声の上限を{queue_audio_limit}秒に変更しました")
+
+    @guild_setting.command(name="change-queue-policy", description="上限を超えたときの動作を変更")
+    async def change_queue_policy(
+            self,
+            ctx: BridgeCtx,
+            queue_policy: BridgeOption(
+                str,
+                "oldest: 古いものを捨てる / newest: 新しいものを捨てる / latest: 最新の数件まで飛ばす",
+                choices=list(database.SettingLoader.queue_policies)
+            )
+    ):
+        if queue_policy not in database.SettingLoader.queue_policies:
+            await ctx.respond("oldest, newest, latestのいずれかを指定してください")
+            return
+        self.vm.guild_settings.update(ctx.guild.id, "queue_policy", queue_policy)
+        await ctx.respond(f"上限を超えたときの動作を{queue_policy}に変更しました")
+
+    @guild_setting.command(name="change-queue-keep", description="latestで残すメッセージ数を変更")
+    async def change_queue_keep(
+            self,
+            ctx: BridgeCtx,
+            queue_keep: BridgeOption(int, "latestで残すメッセージ数", min_value=1, max_value=50)
+    ):
+        if not (1 <= queue_keep <= 50):
+            await ctx.respond("残すメッセージ数は1から50の間で指定してください")
+            return
+        self.vm.guild_settings.update(ctx.guild.id, "queue_keep", queue_keep)
+        await ctx.respond(f"latestで残すメッセージ数を{queue_keep}件に変更しました")
+
+    @guild_setting.command(name="change-coalesce", description="連続したメッセージをまとめて読む間隔を変更")
+    async def change_coalesce(
+            self,
+            ctx: BridgeCtx,
+            coalesce_ms: BridgeOption(int, "同じユーザーの連続したメッセージをまとめる間隔(ミリ秒、0で無効)",
+                                      min_value=0, max_value=10000)
+    ):
+        if not (0 <= coalesce_ms <= 10000):
+            await ctx.respond("間隔は0から10000ミリ秒の間で指定してください")
+            return
+        self.vm.guild_settings.update(ctx.guild.id, "coalesce_ms", coalesce_ms)
+        await ctx.respond(f"連続したメッセージをまとめる間隔を{coalesce_ms}ミリ秒に変更しました")
+
+    @guild_setting.command(name="change-segment", description="文章を区切って合成する長さを変更")
+    async def change_segment(
+            self,
+            ctx: BridgeCtx,
+            first: BridgeOption(int, "最初に合成する文字数の目安(0で句読点ごと)", min_value=0, max_value=200),
+            size: BridgeOption(int, "2つ目以降に合成する文字数の目安(0で句読点ごと)", min_value=0, max_value=500)
+    ):
+        if not (0 <= first <= 200 and 0 <= size <= 500):
+            await ctx.respond("最初は0から200、2つ目以降は0から500の間で指定してください")
+            return
+        self.vm.guild_settings.update(ctx.guild.id, "segment_first", first)
+        self.vm.guild_settings.update(ctx.guild.id, "segment_size", size)
+        await ctx.respond(f"最初は{first}文字、2つ目以降は{size}文字を目安に区切るように変更しました")
+
     @guild_setting.command(name="ignore-user-add", description="読み上げを無視するユーザーを追加")
     async def add_ignore_user(
             self,
@@ -492,11 +566,7 @@ class GuildCommands(commands.Cog):
     ):
         guild_id = ctx.guild.id
         setting = self.vm.guild_settings.get(guild_id)
-        speaker = "不明"
-        for k, v in styles.items():
-            if v == setting.speaker:
-                speaker = k
-                break
+        speaker = (await self.vm.fetch_speakers()).style_name(setting.speaker) or "不明"
         if json:
             settings = asdict(setting)
             await ctx.respond(
@@ -516,7 +586,12 @@ class GuildCommands(commands.Cog):
                             f"リプライユーザー読み上げ: `{bool(setting.read_replyuser)}`\n"
                             f"ニックネーム使用: `{bool(setting.read_nick)}`\n"
                             f"除外ユーザー: `{len(setting.ignore_users)}`人\n"
-                            f"除外ロール: `{len(setting.ignore_roles)}`個"
+                            f"除外ロール: `{len(setting.ignore_roles)}`個\n"
+                            f"読み上げ待ち上限: `{setting.queue_limit}`件\n"
+                            f"再生待ち上限: `{setting.queue_audio_limit}`秒\n"
+                            f"上限超過時: `{setting.queue_policy}` (latestで残す件数: `{setting.queue_keep}`)\n"
+                            f"連続メッセージをまとめる間隔: `{setting.coalesce_ms}`ミリ秒\n"
+                            f"区切る文字数: 最初`{setting.segment_first}`文字 / 以降`{setting.segment_size}`文字"
             )
             await ctx.respond(embed=embed)
 
@@ -607,7 +682,7 @@ class GuildCommands(commands.Cog):
 
 
 def setup(bot: voicemanager.VoiceManagedBot):
-    global styles
-    styles = bot.voice_manager.speakers.styles()
+    # load the speaker catalogue before the first command
+    bot.voice_manager.speakers
     bot.add_cog(UserCommands(bot, bot.voice_manager))
     bot.add_cog(GuildCommands(bot, bot.voice_manager))
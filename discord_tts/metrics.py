@@ -0,0 +1,104 @@
+import threading
+from collections import Counter, deque
+from collections.abc import Hashable
+from dataclasses import dataclass
+
+
+@dataclass
+class LatencySummary:
+    """
+    Summary of the recent latency samples in seconds
+    """
+    count: int = 0
+    mean: float = 0.0
+    p50: float = 0.0
+    p95: float = 0.0
+    p99: float = 0.0
+    max: float = 0.0
+
+
+class LatencyRecorder:
+    """
+    Keeps the most recent latency samples and summarizes them.
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        """
+        Create the recorder.
+        :param size: Number of recent samples to keep
+        """
+        self._samples: deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count: int = 0
+
+    def record(self, seconds: float) -> None:
+        """
+        Add a sample.
+        :param seconds: Latency in seconds
+        :return: None
+        """
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def summary(self) -> LatencySummary:
+        """
+        Summarize the recent samples.
+        count is the number of samples recorded since start.
+        :return: LatencySummary object
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return LatencySummary()
+
+        def percentile(p: float) -> float:
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        return LatencySummary(
+            self.count,
+            sum(samples) / len(samples),
+            percentile(0.50),
+            percentile(0.95),
+            percentile(0.99),
+            samples[-1]
+        )
+
+
+class EventCounter:
+    """
+    Thread safe counter of events such as dropped messages.
+    """
+
+    def __init__(self) -> None:
+        self._counts: Counter[Hashable] = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable, count: int = 1) -> None:
+        """
+        Count the events.
+        :param key: Event key such as (guild id, kind)
+        :param count: Number of events
+        :return: None
+        """
+        if count <= 0:
+            return
+        with self._lock:
+            self._counts[key] += count
+
+    def get(self, key: Hashable) -> int:
+        """
+        Get the count of the key.
+        :param key: Event key
+        :return: count
+        """
+        with self._lock:
+            return self._counts[key]
+
+    def snapshot(self) -> dict[Hashable, int]:
+        """
+        Get every count.
+        :return: dict of key and count
+        """
+        with self._lock:
+            return dict(self._counts)
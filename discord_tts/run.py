@@ -1,5 +1,5 @@
+import atexit
 import os
-import queue
 import logging
 import warnings
 from logging import getLogger, DEBUG, INFO, WARNING
@@ -15,7 +15,8 @@ from dotenv import load_dotenv
 from util import BridgeCtx, JoinButton
 from voicemanager import VoiceManagedBot
 from vv_wrapper import database
-from vv_wrapper.start import start_engine
+from vv_wrapper.call import VoiceVox
+from vv_wrapper.start import EngineSupervisor
 
 logging.basicConfig(level=WARNING)
 
@@ -42,8 +43,18 @@ if not load_dotenv(verbose=True):
         f.write("SHARD_IDS=\n")
         f.write("VV_HOST=127.0.0.1\n")
         f.write("VV_PORT=50021\n")
+        f.write("VV_HOSTS=\n")
         f.write("VV_PATH=\n")
         f.write("VV_ARGS=\n")
+        f.write("VV_ENGINE_COUNT=1\n")
+        f.write("VV_ENGINE_THREADS=\n")
+        f.write("VV_POOL_SIZE=16\n")
+        f.write("VV_TIMEOUT=30\n")
+        f.write("VV_CACHE_SIZE=32\n")
+        f.write("VV_QUERY_CACHE_SIZE=8\n")
+        f.write("VV_DISK_CACHE_DIR=\n")
+        f.write("VV_DISK_CACHE_SIZE=1024\n")
+        f.write("VV_OUTPUT_48K=0\n")
 token = os.getenv("TOKEN")
 prefix = os.getenv("COMMAND_PREFIX")
 if not token:
@@ -80,6 +91,21 @@ else:
     bot = VoiceManagedBot(intents=intents, command_prefix=prefix, shard_ids=shard_ids, shard_count=shard_count)
 
 vm = bot.voice_manager
+if os.getenv("VV_HOSTS"):
+    VoiceVox.set_engines([
+        (endpoint.rsplit(":", 1)[0], int(endpoint.rsplit(":", 1)[1])) for endpoint in os.getenv("VV_HOSTS").split(",")
+    ])
+else:
+    VoiceVox.set_host(os.getenv("VV_HOST") or None, int(os.getenv("VV_PORT") or 50021))
+VoiceVox.set_pool(
+    pool_maxsize=int(os.getenv("VV_POOL_SIZE") or 16),
+    timeout=(3.0, float(os.getenv("VV_TIMEOUT") or 30))
+)
+VoiceVox.set_audio_cache(int(os.getenv("VV_CACHE_SIZE") or 32) * 1024 * 1024)
+VoiceVox.set_query_cache(int(os.getenv("VV_QUERY_CACHE_SIZE") or 8) * 1024 * 1024)
+VoiceVox.set_disk_cache(os.getenv("VV_DISK_CACHE_DIR"), int(os.getenv("VV_DISK_CACHE_SIZE") or 1024) * 1024 * 1024)
+if os.getenv("VV_OUTPUT_48K") == "1":
+    VoiceVox.set_output_format(48000, True)
 database.DictionaryLoader.set_db_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "dictionary.db"))
 
 
@@ -130,7 +156,7 @@ async def on_message(message: discord.Message):
             return
         elif message.author.voice.channel != bot.voice_clients_dict[message.guild.id].channel:
             return
-    vm.speak_message_q.put(message)
+    vm.speak_message(message)
 
 
 @bot.event
@@ -184,7 +210,7 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
         if after.channel.id == client.channel.id:
             if before.channel == after.channel:
                 return
-            vm.speak(f"{replacer.replace(name)}さんが参加しました", guild=guild_id)
+            vm.speak(f"{vm.replace_text(name, replacer)}さんが参加しました", guild=guild_id)
             return
     elif before.channel is not None:
         if before.channel.id == client.channel.id:
@@ -194,13 +220,13 @@ async def on_voice_state_update(member: discord.Member, before: discord.VoiceSta
                 await vm.disconnect(guild_id)
                 say_clock.stop()
             else:
-                vm.speak(f"{replacer.replace(name)}さんが退出しました", guild=guild_id)
+                vm.speak(f"{vm.replace_text(name, replacer)}さんが退出しました", guild=guild_id)
             return
 
 
-@tasks.loop(seconds=0.1)
+@tasks.loop(seconds=5)
 async def say_clock():
-    """Check if the bot is speaking and play the next source if it is not playing."""
+    """Disconnect from empty channels and restart playback that has stalled."""
     for vc in list(bot.voice_clients_dict.values()):
         # RuntimeError: dictionary changed size during iteration
         if vc is None:
@@ -212,13 +238,7 @@ async def say_clock():
                 continue
         if len(vc.channel.members) < 2:
             await vm.disconnect(vc.guild.id)
-        if not vc.is_playing():
-            try:
-                source = vm.speak_source_q.get_nowait()
-                vc.play(source)
-
-            except queue.Empty:
-                continue
+    vm.play_pending()
 
 
 @tasks.loop(minutes=5)
@@ -298,12 +318,61 @@ async def leave(ctx: BridgeCtx):
 
 @bot.bridge_command(name="cancel", description="読み上げをキャンセルする")
 async def cancel(ctx: BridgeCtx):
-    """Cancel the reading."""
+    """Cancel the reading and drop every pending message."""
+    if ctx.guild.id not in vm.read_channels:
+        await ctx.respond("接続されていません")
+        return
+    discarded = vm.cancel(ctx.guild.id)
+    await ctx.respond(
+        f"読み上げをキャンセルしました (メッセージ{discarded.messages}件、"
+        f"音声{discarded.seconds:.1f}秒分を破棄)",
+        delete_after=5
+    )
+
+
+@bot.bridge_command(name="skip", description="読み上げ中のメッセージを飛ばす")
+async def skip(ctx: BridgeCtx):
+    """Skip the message being read."""
     if ctx.guild.id not in vm.read_channels:
         await ctx.respond("接続されていません")
         return
-    ctx.voice_client.stop()
-    await ctx.respond("読み上げをキャンセルしました", delete_after=5)
+    discarded = vm.skip(ctx.guild.id)
+    await ctx.respond(f"読み上げ中のメッセージを飛ばしました (音声{discarded.seconds:.1f}秒分を破棄)", delete_after=5)
+
+
+@bot.bridge_command(name="stats", description="読み上げの統計を表示する")
+async def stats(ctx: BridgeCtx):
+    """Show the latency and cache statistics."""
+    latency = vm.first_audio_latency.summary()
+    audio = VoiceVox.audio_cache.stats()
+    query = VoiceVox.query_cache.stats()
+    replaced = vm.replace_cache.stats()
+    embed = Embed(title="読み上げ統計")
+    embed.add_field(
+        name="受信から再生開始まで",
+        value=f"p50 `{latency.p50 * 1000:.0f}ms` / p95 `{latency.p95 * 1000:.0f}ms` / "
+              f"最大 `{latency.max * 1000:.0f}ms` ({latency.count}件)",
+        inline=False
+    )
+    embed.add_field(
+        name="音声キャッシュ",
+        value=f"ヒット率 `{audio.hit_rate:.1%}` / {audio.entries}件 / `{audio.size / 1024 / 1024:.1f}MiB`",
+        inline=False
+    )
+    embed.add_field(name="AudioQueryキャッシュ", value=f"ヒット率 `{query.hit_rate:.1%}` / {query.entries}件", inline=False)
+    embed.add_field(name="辞書変換キャッシュ", value=f"ヒット率 `{replaced.hit_rate:.1%}` / {replaced.entries}件", inline=False)
+    queue = vm.speak_message_q.stats(ctx.guild.id)
+    embed.add_field(
+        name="このサーバーの読み上げ待ち",
+        value=f"{queue.depth}件 / 待ち時間 p95 `{queue.wait.p95 * 1000:.0f}ms` / "
+              f"最長待機 `{queue.oldest_wait:.1f}s`\n"
+              f"破棄 メッセージ `{vm.dropped.get((ctx.guild.id, 'message'))}`件 / "
+              f"音声 `{vm.dropped.get((ctx.guild.id, 'audio'))}`件 / "
+              f"期限切れのお知らせ `{vm.dropped.get((ctx.guild.id, 'expired'))}`件\n"
+              f"まとめて読んだメッセージ `{vm.coalesced.get(ctx.guild.id)}`件",
+        inline=False
+    )
+    await ctx.respond(embed=embed)
 
 
 @bot.bridge_command(name="create-button", description="参加ボタンを作成する")
@@ -317,7 +386,18 @@ async def create_button(ctx: BridgeCtx):
 def run(token: str):
     path = os.getenv("VV_PATH")
     if path:
-        start_engine(path + " " + os.getenv("VV_ARGS", ""))
+        supervisor = EngineSupervisor(
+            path,
+            os.getenv("VV_ARGS", ""),
+            count=int(os.getenv("VV_ENGINE_COUNT") or 1),
+            host=os.getenv("VV_HOST") or "127.0.0.1",
+            base_port=int(os.getenv("VV_PORT") or 50021),
+            cpu_num_threads=int(os.getenv("VV_ENGINE_THREADS") or 0) or None,
+            pool=VoiceVox.engines
+        )
+        supervisor.start()
+        atexit.register(supervisor.stop)
+    VoiceVox.engines.start_health_checks()
     bot.load_extension("cog")
     bot.run(token)
 
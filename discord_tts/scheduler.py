@@ -0,0 +1,238 @@
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass, field
+from queue import Empty
+from typing import Generic, Optional, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+
+@dataclass
+class Entry(Generic[T]):
+    """
+    Queued item and its estimated cost
+    """
+    item: T
+    cost: int
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class QueueStats:
+    """
+    State of one key's queue
+    """
+    depth: int = 0
+    cost: int = 0
+    oldest_wait: float = 0.0
+    wait: metrics.LatencySummary = field(default_factory=metrics.LatencySummary)
+
+
+class _Lane(Generic[T]):
+    """
+    Deficit round robin state of one priority
+    """
+
+    def __init__(self) -> None:
+        self.queues: dict[Hashable, deque[Entry[T]]] = {}
+        self.deficits: dict[Hashable, int] = {}
+        self.active: deque[Hashable] = deque()
+        self.visiting: Optional[Hashable] = None
+
+    def put(self, key: Hashable, entry: Entry[T]) -> None:
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            self.deficits[key] = 0
+            self.active.append(key)
+        queue.append(entry)
+
+    def get(self, quantum: int) -> tuple[Hashable, Entry[T]]:
+        while True:
+            key = self.active[0]
+            if self.visiting != key:
+                self.visiting = key
+                self.deficits[key] += quantum
+            queue = self.queues[key]
+            if self.deficits[key] >= queue[0].cost:
+                entry = queue.popleft()
+                self.deficits[key] -= entry.cost
+                if not queue:
+                    self.drop(key)
+                return key, entry
+            self.active.rotate(-1)
+            self.visiting = None
+
+    def drop(self, key: Hashable) -> deque[Entry[T]]:
+        queue = self.queues.pop(key)
+        del self.deficits[key]
+        self.active.remove(key)
+        if self.visiting == key:
+            self.visiting = None
+        return queue
+
+
+class FairScheduler(Generic[T]):
+    """
+    Thread safe queue serving keys (guilds) by deficit round robin.
+    Each key earns quantum cost units per round and spends the cost of the items it takes,
+    so a key with many or long items cannot starve the others.
+    Items are put in priority lanes, and a lane is served only while every lane with a
+    lower priority value is empty. Items of the same key and priority are served in order.
+    """
+
+    def __init__(self, quantum: int = 100, history: int = 100) -> None:
+        """
+        Create the scheduler.
+        :param quantum: Cost units a key earns per round
+        :param history: Number of wait times kept per key
+        """
+        self.quantum: int = quantum
+        self.history: int = history
+        self._lanes: dict[int, _Lane[T]] = {}
+        self._waits: dict[Hashable, metrics.LatencyRecorder] = {}
+        self._condition = threading.Condition()
+
+    def put(self, key: Hashable, item: T, cost: int = 1, priority: int = 0) -> None:
+        """
+        Add the item to the queue of the key.
+        :param key: Queue key such as guild id
+        :param item: Item to add
+        :param cost: Estimated cost, such as the text length
+        :param priority: Priority lane, lower values are served first
+        :return: None
+        """
+        with self._condition:
+            lane = self._lanes.get(priority)
+            if lane is None:
+                lane = self._lanes[priority] = _Lane()
+                self._lanes = dict(sorted(self._lanes.items()))
+            lane.put(key, Entry(item, max(cost, 1)))
+            self._condition.notify()
+
+    def merge(
+            self,
+            key: Hashable,
+            item: T,
+            cost: int,
+            merge: Callable[[T, T], bool],
+            priority: int = 0
+    ) -> bool:
+        """
+        Merge the item into the last queued item of the key while it is still waiting.
+        :param key: Queue key
+        :param item: New item
+        :param cost: Estimated cost of the new item, added to the merged entry
+        :param merge: Function called with the queued item and the new item,
+                      returns True if it merged the new item into the queued one
+        :param priority: Priority lane
+        :return: True if merged, False if the item still has to be put
+        """
+        with self._condition:
+            lane = self._lanes.get(priority)
+            queue = lane.queues.get(key) if lane is not None else None
+            if not queue or not merge(queue[-1].item, item):
+                return False
+            queue[-1].cost += max(cost, 1)
+            return True
+
+    def _ready(self) -> bool:
+        return any(lane.active for lane in self._lanes.values())
+
+    def get(self, timeout: Optional[float] = None) -> T:
+        """
+        Take the next item of the highest priority lane by deficit round robin.
+        :param timeout: Seconds to wait for an item, None to wait forever
+        :return: Item
+        :raises Empty: No item arrived in time
+        """
+        with self._condition:
+            if not self._condition.wait_for(self._ready, timeout):
+                raise Empty
+            lane = next(lane for lane in self._lanes.values() if lane.active)
+            key, entry = lane.get(self.quantum)
+            self._waits.setdefault(key, metrics.LatencyRecorder(self.history)).record(
+                time.perf_counter() - entry.enqueued_at)
+            return entry.item
+
+    def _lanes_of(self, priority: Optional[int]) -> list[_Lane[T]]:
+        if priority is None:
+            return list(self._lanes.values())
+        lane = self._lanes.get(priority)
+        return [lane] if lane is not None else []
+
+    def remove(self, key: Hashable, priority: Optional[int] = None) -> list[T]:
+        """
+        Remove every queued item of the key.
+        :param key: Queue key
+        :param priority: Priority lane, None for every lane
+        :return: Removed items
+        """
+        removed = []
+        with self._condition:
+            for lane in self._lanes_of(priority):
+                if key in lane.queues:
+                    removed += [entry.item for entry in lane.drop(key)]
+        return removed
+
+    def trim(self, key: Hashable, keep: int, priority: int = 0) -> list[T]:
+        """
+        Remove the oldest items of the key in the lane until at most keep items are left.
+        :param key: Queue key
+        :param keep: Number of items to keep
+        :param priority: Priority lane
+        :return: Removed items, oldest first
+        """
+        if keep <= 0:
+            return self.remove(key, priority)
+        with self._condition:
+            lane = self._lanes.get(priority)
+            if lane is None or key not in lane.queues:
+                return []
+            queue = lane.queues[key]
+            return [queue.popleft().item for _ in range(len(queue) - keep)]
+
+    def clear(self) -> None:
+        """
+        Remove every queued item.
+        :return: None
+        """
+        with self._condition:
+            self._lanes.clear()
+
+    def depth(self, key: Hashable, priority: Optional[int] = None) -> int:
+        """
+        Number of queued items of the key
+        :param key: Queue key
+        :param priority: Priority lane, None for every lane
+        :return: number of items
+        """
+        with self._condition:
+            return sum(len(lane.queues.get(key, ())) for lane in self._lanes_of(priority))
+
+    def stats(self, key: Hashable) -> QueueStats:
+        """
+        Get the queue depth and wait times of the key over every lane.
+        :param key: Queue key
+        :return: QueueStats object
+        """
+        with self._condition:
+            entries = [entry for lane in self._lanes.values() for entry in lane.queues.get(key, ())]
+            waits = self._waits.get(key)
+            return QueueStats(
+                len(entries),
+                sum(entry.cost for entry in entries),
+                time.perf_counter() - min(entry.enqueued_at for entry in entries) if entries else 0.0,
+                waits.summary() if waits is not None else metrics.LatencySummary()
+            )
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(queue) for lane in self._lanes.values() for queue in lane.queues.values())
+
+    def __repr__(self):
+        return f"FairScheduler({len(self._lanes)} lanes, quantum={self.quantum})"
@@ -0,0 +1,47 @@
+import re
+
+# clause boundaries, the punctuation is kept with the clause before it
+CLAUSE = re.compile(r"[^、。，．,！？!?\n]*(?:[、。，．,！？!?]+|\n|$)")
+PUNCTUATION = "、。，．,！？!?"
+
+
+def clauses(text: str) -> list[str]:
+    """
+    Split the text after every punctuation mark and line break.
+    Clauses without readable characters are dropped.
+    :param text: text to split
+    :return: clauses with their trailing punctuation
+    """
+    result = []
+    for match in CLAUSE.finditer(text):
+        clause = match.group().strip()
+        if clause.strip(PUNCTUATION):
+            result.append(clause)
+    return result
+
+
+def segment(text: str, first_size: int = 20, chunk_size: int = 80) -> list[str]:
+    """
+    Split the text into chunks to synthesize.
+    The first chunk holds clauses up to first_size characters so that it is synthesized quickly,
+    and the following chunks pack clauses up to chunk_size characters to save engine calls
+    and the padding added to the end of every chunk.
+    A clause longer than the budget is kept whole, and "。" is put between clauses split by a line break.
+    :param text: text to split
+    :param first_size: character budget of the first chunk, 0 to split every clause
+    :param chunk_size: character budget of the other chunks, 0 to split every clause
+    :return: non-empty chunks
+    """
+    chunks: list[str] = []
+    current = ""
+    for clause in clauses(text):
+        budget = chunk_size if chunks else first_size
+        if current and len(current) + len(clause) + 1 > budget:
+            chunks.append(current)
+            current = ""
+        if current and current[-1] not in PUNCTUATION:
+            current += "。"
+        current += clause
+    if current:
+        chunks.append(current)
+    return chunks
@@ -1,9 +1,14 @@
+import asyncio
 import io
-import re
+import sys
 import threading
 import time
 import warnings
-from queue import Empty, Queue
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from logging import getLogger
+from queue import Empty
 from subprocess import DEVNULL
 from typing import Optional, overload
 
@@ -11,13 +16,111 @@ import discord
 from discord import VoiceProtocol, VoiceClient
 from discord.ext import bridge
 
+import audio
+import metrics
+import segmenter
+from scheduler import FairScheduler
 from vv_wrapper import call, database
+from vv_wrapper.cache import LRUCache
+
+logger = getLogger(__name__)
 
 UserID = int
 ChannelID = int
 GuildID = int
 
 
+class Priority(IntEnum):
+    """Queue lanes, lower values are synthesized and played first."""
+    SYSTEM = 0
+    CHAT = 1
+
+
+@dataclass
+class SpeakRequest:
+    """A message or announcement waiting to be read."""
+    text: str
+    guild: Optional[GuildID] = None
+    user: Optional[discord.Member | discord.User] = None
+    message: Optional[discord.Message] = None
+    received_at: float = field(default_factory=time.perf_counter)
+    first_audio_at: Optional[float] = None
+    priority: Priority = Priority.CHAT
+    ttl: Optional[float] = None
+    cancelled: bool = False
+    # arrival of the last message coalesced into this request
+    updated_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether the request is older than its ttl and should not be read anymore.
+        :return: True if expired
+        """
+        return self.ttl is not None and time.perf_counter() - self.received_at > self.ttl
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "SpeakRequest":
+        """
+        Create a request from a chat message.
+        :param message: discord message
+        :return: SpeakRequest object
+        """
+        return cls(message.clean_content, message.guild.id, message.author, message)
+
+
+@dataclass
+class AudioClip:
+    """
+    Synthesized audio waiting to be played.
+    Only the bytes are held, the playable source is created when it starts playing.
+    """
+    wav: bytes = field(repr=False)
+    request: SpeakRequest
+    duration: float = field(init=False)
+
+    def __post_init__(self):
+        self.duration = audio.wav_duration(self.wav)
+
+
+@dataclass
+class Synthesis:
+    """Synthesis of one request running on the event loop."""
+    request: SpeakRequest
+    tasks: list[asyncio.Task] = field(repr=False)
+    # set when every clip of the request has been queued or dropped
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+
+@dataclass
+class Discarded:
+    """Work thrown away by cancel or skip."""
+    messages: int = 0
+    clips: int = 0
+    seconds: float = 0.0
+    aborted: int = 0
+
+
+class TimedSource(discord.AudioSource):
+    """Wraps an audio source to measure the latency until the first frame of a request is sent."""
+    def __init__(self, source: discord.AudioSource, request: SpeakRequest, recorder: metrics.LatencyRecorder):
+        self.source: discord.AudioSource = source
+        self.request: SpeakRequest = request
+        self.recorder: metrics.LatencyRecorder = recorder
+
+    def read(self) -> bytes:
+        if self.request.first_audio_at is None:
+            self.request.first_audio_at = time.perf_counter()
+            self.recorder.record(self.request.first_audio_at - self.request.received_at)
+        return self.source.read()
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self) -> None:
+        self.source.cleanup()
+
+
 class VoiceManagedBot(bridge.AutoShardedBot):
     """A subclass of discord.Bot that has a VoiceManager instance."""
     def __init__(self, *args, **kwargs):
@@ -58,11 +161,37 @@ class VoiceManager:
         # self.speak_channels: dict[GuildID, discord.VoiceChannel] = {}
         # self.voice_clients: dict[GuildID, discord.VoiceClient] = {}
 
-        self.speak_message_q: Queue[discord.Message | dict[str, str | GuildID | UserID]] = Queue()
-        self.speak_source_q: Queue[discord.AudioSource] = Queue()
+        # synthesis work is shared between guilds by text length
+        self.speak_message_q: FairScheduler[SpeakRequest] = FairScheduler()
+        # changed only on the event loop
+        self.playback_queues: dict[GuildID, deque[AudioClip]] = {}
+        self._playing: dict[GuildID, AudioClip] = {}
+        # requests taken by the converter thread whose synthesis has not started yet, keyed by id
+        self._converting: dict[int, SpeakRequest] = {}
+        # requests being synthesized in the order their clips are queued, changed only on the event loop
+        self._in_flight: dict[Optional[GuildID], deque[Synthesis]] = {}
         self.converter_loop: Optional[bool] = True
         self.converter_thread: Optional[threading.Thread] = None
         self.converter_interval: float = 0.1
+        self.batch_synthesis: bool = True
+        self.synthesis_workers: int = 4
+        self._dispatch_slots: threading.BoundedSemaphore = threading.BoundedSemaphore(self.synthesis_workers)
+        self.synthesis_timeout: float = 60.0
+        self._synthesis_slots: Optional[asyncio.Semaphore] = None
+        self.first_audio_latency: metrics.LatencyRecorder = metrics.LatencyRecorder()
+        # keyed by (guild id, "message", "audio" or "expired")
+        self.dropped: metrics.EventCounter = metrics.EventCounter()
+        # messages merged into the previous message of the same author, keyed by guild id
+        self.coalesced: metrics.EventCounter = metrics.EventCounter()
+        # seconds after which a join/leave announcement is not worth reading
+        self.announcement_ttl: float = 15.0
+        # decode WAV in process instead of starting ffmpeg for each clip
+        self.in_process_audio: bool = True
+        # replaced text keyed by (text, user dictionary version, guild dictionary version),
+        # sized by the memory of both the input and the output strings
+        self.replace_cache: LRUCache[str] = LRUCache(8 * 1024 * 1024)
+
+        self.speaker_catalogue: call.SpeakerCatalogue = call.SpeakerCatalogue()
 
         self.user_replacers: database.ReplacerHolder = database.ReplacerHolder("user", {})
         self.guild_replacers: database.ReplacerHolder = database.ReplacerHolder("guild", {})
@@ -77,10 +206,17 @@ class VoiceManager:
     @property
     def speakers(self) -> call.SpeakersHolder:
         """
-        Get the available speakers from VoiceVox.
+        Get the available speakers from the cached catalogue.
         :return: A SpeakersHolder object containing the available speakers.
         """
-        return call.VoiceVox.get_speakers()
+        return self.speaker_catalogue.get()
+
+    async def fetch_speakers(self) -> call.SpeakersHolder:
+        """
+        Get the available speakers from VoiceVox without blocking the event loop.
+        :return: A SpeakersHolder object containing the available speakers.
+        """
+        return await self.speaker_catalogue.aget()
 
     def get_user_setting(self, user_id: int) -> database.UserSetting:
         """
@@ -111,6 +247,36 @@ class VoiceManager:
         for guild_id in guild_ids:
             self.set_replacer(guild_id)
 
+    def replace_text(
+            self,
+            text: str,
+            user_replacer: Optional[database.Replacer] = None,
+            guild_replacer: Optional[database.Replacer] = None
+    ) -> str:
+        """
+        Apply the user dictionary and then the guild dictionary, remembering the result.
+        Every change of a dictionary gives it a new version, so results of older dictionaries are never returned.
+        :param text: Text to be replaced
+        :param user_replacer: Dictionary of the author, None to skip
+        :param guild_replacer: Dictionary of the guild, None to skip
+        :return: Replaced text
+        """
+        key = (
+            text,
+            user_replacer.version if user_replacer is not None else None,
+            guild_replacer.version if guild_replacer is not None else None
+        )
+        replaced = self.replace_cache.get(key)
+        if replaced is not None:
+            return replaced
+        replaced = text
+        if user_replacer is not None:
+            replaced = user_replacer.replace(replaced)
+        if guild_replacer is not None:
+            replaced = guild_replacer.replace(replaced)
+        self.replace_cache.put(key, replaced, sys.getsizeof(text) + sys.getsizeof(replaced))
+        return replaced
+
     async def stop(self):
         """
         Stop the voice manager.
@@ -118,18 +284,20 @@ class VoiceManager:
         """
         await self.disconnect(-1)
         self.qclear()
+        await call.AsyncVoiceVox.close()
         # self.voice_clients.clear()
         self.read_channels.clear()
         self.speak_channels.clear()
 
     def qclear(self):
         """
-        Clear the speak_message_q and speak_source_q.
-        cleanup the queues.
+        Clear the speak_message_q and playback queues.
+        queued clips are plain bytes, so nothing has to be cleaned up.
         :return:
         """
-        self.speak_message_q = Queue()
-        self.speak_source_q = Queue()
+        self.speak_message_q.clear()
+        self.playback_queues.clear()
+        self._playing.clear()
 
     async def disconnect(self, guild_id: int):
         """
@@ -142,6 +310,8 @@ class VoiceManager:
             if guild_id > 0:
                 try:
                     await self.bot.voice_clients_dict[guild_id].disconnect()
+                    self.playback_queues.pop(guild_id, None)
+                    self._playing.pop(guild_id, None)
                     self.read_channels.pop(guild_id)
                     # self.voice_clients.pop(guild_id)
                 except KeyError:
@@ -175,74 +345,324 @@ class VoiceManager:
     def _converter(self):
         """
         The main loop of the converter thread.
-        get the text from the speak_message_q and convert it to audio.
-        put the audio in the speak_source_q.
-        apply the user and guild settings to the text.
+        get the text from the speak_message_q, apply the user and guild settings to it
+        and start its synthesis on the event loop.
+        Up to synthesis_workers requests are synthesized at the same time.
         :return:
         """
+        slots = self._dispatch_slots
         while self.converter_loop:
-            user_settings: Optional[database.UserSetting] = None
-            server_settings: Optional[database.GuildSetting] = None
-            message_type: Optional[discord.MessageType] = None
-            ignore_users: list[UserID] = []
-            ignore_roles: list[UserID] = []
-            reply: str = ""
+            # taken before the request so that the scheduler picks the guild when a slot is free
+            if not slots.acquire(timeout=self.converter_interval):
+                continue
             try:
-                message = self.speak_message_q.get()
-                if isinstance(message, discord.Message):
-                    text: str = message.clean_content
-                    guild: int = message.guild.id
-                    user: discord.user = message.author
-                    message_type: discord.MessageType = message.type
-                elif isinstance(message, dict):
-                    text: str = message.get("text")
-                    guild: int = message.get("guild")
-                    user: discord.user = message.get("user")
-                else:
-                    raise TypeError(f"message is not discord.Message or dict, but {type(message).__name__}")
+                request = self.speak_message_q.get(timeout=self.converter_interval)
             except Empty:
+                slots.release()
                 continue
+            if request.expired:
+                self.dropped.add((request.guild, "expired"))
+                slots.release()
+                continue
+            self._converting[id(request)] = request
+            prepared = None
+            try:
+                prepared = self._prepare(request)
+            finally:
+                if prepared is None:
+                    self._converting.pop(id(request), None)
+                    slots.release()
+            if prepared is None:
+                continue
+            jobs, settings = prepared
+            future = asyncio.run_coroutine_threadsafe(self._deliver(request, jobs, settings), self.bot.loop)
+            future.add_done_callback(lambda _: slots.release())
+
+    def _prepare(
+            self,
+            request: SpeakRequest
+    ) -> Optional[tuple[list[list[str]], Optional[database.BaseSetting]]]:
+        """
+        Apply the user and guild settings to the request and split it into synthesis jobs.
+        Runs on the converter thread.
+        :param request: SpeakRequest object
+        :return: fragments of each job and the settings to synthesize them with, None to skip the request
+        """
+        user_settings: Optional[database.UserSetting] = None
+        server_settings: Optional[database.GuildSetting] = None
+        message_type: Optional[discord.MessageType] = None
+        ignore_users: list[UserID] = []
+        ignore_roles: list[UserID] = []
+        reply: str = ""
+        userdict: Optional[database.Replacer] = None
+        text: str = request.text
+        guild: Optional[GuildID] = request.guild
+        user: Optional[discord.User] = request.user
+        message: Optional[discord.Message] = request.message
+        if message is not None:
+            message_type = message.type
+
+        if guild is not None:
+            server_settings = self.guild_settings.get(guild)
+            ignore_users = server_settings.ignore_users
+            ignore_roles = server_settings.ignore_roles
+
+        if user is not None:
+            if user.id in ignore_users:
+                return None
+            if any(role.id in ignore_roles for role in user.roles):
+                return None
+            userdict = self.user_replacers.get(user.id)
+            if message_type == discord.MessageType.reply:
+                if server_settings.read_replyuser:
+                    reply += f"{self.bot.get_message(message.reference.message_id).author.display_name}へ"
+                    reply = self.replace_text(reply, userdict)
+                reply += f"リプライ、"
+
+            user_settings = self.user_settings.get(user.id)
+
+        text = self.replace_text(text, userdict, self.guild_replacers.get(guild) if guild is not None else None)
+        if guild is not None:
+            if server_settings.read_length:
+                if len(text) > server_settings.read_length:
+                    text = text[:server_settings.read_length] + "、以下省略"
+
+        text = reply + text
+        if server_settings is not None:
+            split = segmenter.segment(text, server_settings.segment_first, server_settings.segment_size)
+        else:
+            split = segmenter.segment(text)
 
-            if guild is not None:
-                server_settings = self.guild_settings.get(guild)
-                ignore_users = server_settings.ignore_users
-                ignore_roles = server_settings.ignore_roles
-
-            if user is not None:
-                if user.id in ignore_users:
-                    continue
-                if any(role.id in ignore_roles for role in user.roles):
+        settings = user_settings if user is not None else server_settings
+        if self.batch_synthesis and len(split) > 2:
+            # the first fragment alone so that it can be played while the rest is synthesized
+            jobs = [split[:1], split[1:]]
+        else:
+            jobs = [[t] for t in split]
+        return jobs, settings
+
+    async def _deliver(
+            self,
+            request: SpeakRequest,
+            jobs: list[list[str]],
+            settings: Optional[database.BaseSetting]
+    ) -> None:
+        """
+        Synthesize the jobs of the request and queue the clips for playback.
+        Every job starts at once, but the clips are queued in job order and after
+        the clips of the previous request of the same guild and priority.
+        :param request: SpeakRequest object
+        :param jobs: fragments of each job
+        :param settings: user or guild settings, None for the default voice
+        :return: None
+        """
+        guild = request.guild
+        tasks = [asyncio.ensure_future(self._synthesize(job, settings, guild)) for job in jobs]
+        synthesis = Synthesis(request, tasks)
+        in_flight = self._in_flight.setdefault(guild, deque())
+        # enqueue_clip puts announcements ahead of chat, so only the same priority has to keep its order
+        previous = next((s for s in reversed(in_flight) if s.request.priority == request.priority), None)
+        in_flight.append(synthesis)
+        self._converting.pop(id(request), None)
+        try:
+            if previous is not None:
+                await previous.done.wait()
+            for task in tasks:
+                if request.cancelled:
+                    break
+                try:
+                    wavs = await asyncio.wait_for(task, self.synthesis_timeout)
+                except asyncio.CancelledError:
+                    if task.cancelled():
+                        continue
+                    raise
+                except Exception as e:
+                    logger.warning(f"Failed to synthesize a fragment in guild {guild}: {e!r}")
                     continue
-                userdict = self.user_replacers.get(user.id)
-                if message_type == discord.MessageType.reply:
-                    if server_settings.read_replyuser:
-                        reply += f"{self.bot.get_message(message.reference.message_id).author.display_name}へ"
-                        reply = userdict.replace(reply)
-                    reply += f"リプライ、"
-
-                user_settings = self.user_settings.get(user.id)
-                text = userdict.replace(text)
-
-            if guild is not None:
-                text = self.guild_replacers.get(guild).replace(text)
-                if server_settings.read_length:
-                    if len(text) > server_settings.read_length:
-                        text = text[:server_settings.read_length] + "、以下省略"
-
-            text = reply + text
-            split = re.split("[。、\n]", text)
-
-            for t in split:
-                if user is not None:
-                    wav = call.VoiceVox.synth_from_settings(t, user_settings)
-                elif guild is not None:
-                    wav = call.VoiceVox.synth_from_settings(t, server_settings)
-                else:
-                    wav = call.VoiceVox.synthesize(t)
-                source = discord.FFmpegOpusAudio(io.BytesIO(wav), pipe=True, stderr=DEVNULL)
-                self.speak_source_q.put(source)
-
-            time.sleep(self.converter_interval)
+                if request.cancelled:
+                    break
+                for wav in wavs:
+                    self.enqueue_clip(guild, AudioClip(wav, request))
+        finally:
+            for task in tasks:
+                task.cancel()
+            synthesis.done.set()
+            in_flight.remove(synthesis)
+            if not in_flight and self._in_flight.get(guild) is in_flight:
+                del self._in_flight[guild]
+
+    def audio_source(self, clip: AudioClip) -> discord.AudioSource:
+        """
+        Create the playable source for the clip.
+        Only the WAV header is read here, the audio is converted by the player thread.
+        Falls back to ffmpeg if in-process decoding is disabled or the WAV is not supported.
+        :param clip: AudioClip object
+        :return: discord audio source
+        """
+        source = None
+        if self.in_process_audio:
+            try:
+                source = audio.WavSource(clip.wav)
+            except ValueError as e:
+                logger.warning(f"Falling back to ffmpeg: {e}")
+        if source is None:
+            source = discord.FFmpegOpusAudio(io.BytesIO(clip.wav), pipe=True, stderr=DEVNULL)
+        return TimedSource(source, clip.request, self.first_audio_latency)
+
+    def enqueue_clip(self, guild: Optional[GuildID], clip: AudioClip) -> None:
+        """
+        Add the clip to the playback queue of the guild and play it if the guild is idle.
+        If the queued audio exceeds the guild's queue_audio_limit seconds, the new clip is dropped
+        with the "newest" policy, otherwise the oldest clips are dropped.
+        Must be called on the event loop.
+        :param guild: discord guild id
+        :param clip: AudioClip object
+        :return: None
+        """
+        if guild is None:
+            logger.warning("Dropped a clip without a guild")
+            return
+        if clip.request.cancelled:
+            return
+        queue = self.playback_queues.setdefault(guild, deque())
+        priority = clip.request.priority
+        if priority < Priority.CHAT:
+            # ahead of every clip of a lower priority, announcements are not limited
+            position = next((i for i, c in enumerate(queue) if c.request.priority > priority), len(queue))
+            queue.insert(position, clip)
+            self.play_next(guild)
+            return
+        settings = self.guild_settings.get(guild)
+        limit = settings.queue_audio_limit
+        if limit and sum(c.duration for c in queue) + clip.duration > limit:
+            if settings.queue_policy == "newest":
+                self.dropped.add((guild, "audio"))
+                return
+            queue.append(clip)
+            queued = sum(c.duration for c in queue)
+            chat = [c for c in queue if c.request.priority == Priority.CHAT]
+            dropped = 0
+            while len(chat) > 1 and queued > limit:
+                oldest = chat.pop(0)
+                queue.remove(oldest)
+                queued -= oldest.duration
+                dropped += 1
+            self.dropped.add((guild, "audio"), dropped)
+        else:
+            queue.append(clip)
+        self.play_next(guild)
+
+    def play_next(self, guild: GuildID) -> None:
+        """
+        Start the next queued clip of the guild if its voice client is idle.
+        Must be called on the event loop.
+        :param guild: discord guild id
+        :return: None
+        """
+        vc = self.bot.voice_clients_dict.get(guild)
+        if vc is None or not vc.is_connected() or vc.is_playing() or vc.is_paused():
+            return
+        self._playing.pop(guild, None)
+        queue = self.playback_queues.get(guild)
+        while queue and queue[0].request.expired:
+            queue.popleft()
+            self.dropped.add((guild, "expired"))
+        if not queue:
+            return
+        clip = self._playing[guild] = queue.popleft()
+        vc.play(self.audio_source(clip), after=lambda error: self._after_play(guild, error))
+
+    def _after_play(self, guild: GuildID, error: Optional[Exception]) -> None:
+        # called from the audio player thread when a clip ends
+        if error is not None:
+            logger.warning(f"Playback failed in guild {guild}: {error!r}")
+        self.bot.loop.call_soon_threadsafe(self.play_next, guild)
+
+    def cancel(self, guild: GuildID) -> Discarded:
+        """
+        Stop reading in the guild.
+        Queued messages and clips are dropped and in-flight synthesis is aborted.
+        Must be called on the event loop.
+        :param guild: discord guild id
+        :return: Discarded object with the amount of dropped work
+        """
+        messages = self.speak_message_q.remove(guild)
+        for request in list(self._converting.values()):
+            if request.guild == guild:
+                request.cancelled = True
+        aborted = 0
+        for synthesis in self._in_flight.get(guild, ()):
+            synthesis.request.cancelled = True
+            # also the jobs still waiting for a synthesis slot, which have no engine request yet
+            aborted += sum(task.cancel() for task in synthesis.tasks)
+        # abort the engine requests now instead of when their jobs resume
+        call.AsyncVoiceVox.cancel(guild)
+        clips = self.playback_queues.pop(guild, deque())
+        discarded = Discarded(len(messages), len(clips), sum(c.duration for c in clips), aborted)
+        vc = self.bot.voice_clients_dict.get(guild)
+        if vc is not None and (vc.is_playing() or vc.is_paused()):
+            vc.stop()
+        return discarded
+
+    def skip(self, guild: GuildID) -> Discarded:
+        """
+        Skip the rest of the message being played in the guild.
+        Its queued clips are dropped and its in-flight synthesis is aborted.
+        Must be called on the event loop.
+        :param guild: discord guild id
+        :return: Discarded object with the amount of dropped work
+        """
+        playing = self._playing.get(guild)
+        if playing is None:
+            return Discarded()
+        request = playing.request
+        request.cancelled = True
+        queue = self.playback_queues.get(guild, deque())
+        clips = [c for c in queue if c.request is request]
+        self.playback_queues[guild] = deque(c for c in queue if c.request is not request)
+        discarded = Discarded(0, len(clips), sum(c.duration for c in clips))
+        for synthesis in self._in_flight.get(guild, ()):
+            if synthesis.request is request:
+                discarded.aborted = sum(task.cancel() for task in synthesis.tasks)
+        vc = self.bot.voice_clients_dict.get(guild)
+        if vc is not None and (vc.is_playing() or vc.is_paused()):
+            # the after callback plays the next message
+            vc.stop()
+        return discarded
+
+    def play_pending(self) -> None:
+        """
+        Start the next queued clip of every idle guild.
+        Playback normally advances from the voice client's after callback, this only recovers stalled guilds.
+        Must be called on the event loop.
+        :return: None
+        """
+        for guild in list(self.playback_queues):
+            self.play_next(guild)
+
+    async def _synthesize(
+            self,
+            texts: list[str],
+            settings: Optional[database.BaseSetting],
+            guild: Optional[GuildID] = None
+    ) -> list[bytes]:
+        """
+        Synthesize the fragments on the event loop.
+        At most synthesis_workers jobs run at the same time.
+        The requests are tagged with the guild so that cancel can abort them.
+        :param texts: fragments to synthesize in one job
+        :param settings: user or guild settings, None for the default voice
+        :param guild: discord guild id
+        :return: wav bytes in the order of texts
+        """
+        if self._synthesis_slots is None:
+            self._synthesis_slots = asyncio.Semaphore(self.synthesis_workers)
+        async with self._synthesis_slots:
+            if settings is None:
+                coro = call.AsyncVoiceVox.synthesize_many(texts)
+            else:
+                coro = call.AsyncVoiceVox.synth_many_from_settings(texts, settings)
+            return await call.AsyncVoiceVox.create_task(coro, guild)
 
     def start_converter(self):
         """
@@ -250,6 +670,7 @@ class VoiceManager:
         :return:
         """
         self.converter_loop = True
+        self._dispatch_slots = threading.BoundedSemaphore(self.synthesis_workers)
         self.converter_thread = threading.Thread(target=self._converter)
         self.converter_thread.start()
 
@@ -263,13 +684,85 @@ class VoiceManager:
         if join:
             self.converter_thread.join()
 
-    def speak(self, text: str, guild: int = None, user: discord.user = None):
+    @staticmethod
+    def _coalesce(queued: SpeakRequest, request: SpeakRequest, window: float) -> bool:
+        # replies keep their own request so that the replied user is read
+        if request.message is None or request.message.type == discord.MessageType.reply:
+            return False
+        if queued.message is None or queued.cancelled or queued.user is None or request.user is None:
+            return False
+        if queued.user.id != request.user.id or request.received_at - queued.updated_at > window:
+            return False
+        queued.text += "\n" + request.text
+        queued.updated_at = request.received_at
+        return True
+
+    def speak(
+            self,
+            text: str,
+            guild: int = None,
+            user: discord.user = None,
+            priority: Priority = Priority.SYSTEM,
+            ttl: Optional[float] = None
+    ):
         """
         Speak the text.
         add the text to the speak_message_q.
+        By default the text is an announcement, read before queued chat messages
+        and dropped if it is not read within announcement_ttl seconds.
         :param text: content of the message
         :param guild: discord guild id to apply the guild settings and replacers
         :param user: discord user id to apply the user settings and replacers
+        :param priority: Queue lane
+        :param ttl: Seconds until the text is dropped, defaults to announcement_ttl for announcements
         :return: None
         """
-        self.speak_message_q.put({"text": text, "guild": guild, "user": user})
+        if ttl is None and priority == Priority.SYSTEM:
+            ttl = self.announcement_ttl
+        self.enqueue(SpeakRequest(text, guild, user, priority=priority, ttl=ttl))
+
+    def speak_message(self, message: discord.Message) -> None:
+        """
+        Read the chat message.
+        add the message to the speak_message_q.
+        :param message: discord message
+        :return: None
+        """
+        self.enqueue(SpeakRequest.from_message(message))
+
+    def enqueue(self, request: SpeakRequest) -> None:
+        """
+        Add the request to the synthesis queue of its guild and priority.
+        The guild's queue_limit is applied to chat messages by its queue_policy:
+        "oldest" drops the oldest messages, "newest" drops the new message
+        and "latest" skips to the latest queue_keep messages.
+        With coalesce_ms set, a message is merged into the queued previous message of the same author
+        if it arrives within coalesce_ms of it.
+        :param request: SpeakRequest object
+        :return: None
+        """
+        if request.guild is None or request.priority != Priority.CHAT:
+            self.speak_message_q.put(request.guild, request, len(request.text), request.priority)
+            return
+        settings = self.guild_settings.get(request.guild)
+        if settings.coalesce_ms and self.speak_message_q.merge(
+                request.guild,
+                request,
+                len(request.text),
+                lambda queued, new: self._coalesce(queued, new, settings.coalesce_ms / 1000),
+                Priority.CHAT
+        ):
+            self.coalesced.add(request.guild)
+            return
+        limit = settings.queue_limit
+        if limit and self.speak_message_q.depth(request.guild, Priority.CHAT) >= limit:
+            if settings.queue_policy == "newest":
+                self.dropped.add((request.guild, "message"))
+                return
+            self.speak_message_q.put(request.guild, request, len(request.text), Priority.CHAT)
+            keep = limit if settings.queue_policy == "oldest" else min(settings.queue_keep, limit)
+            dropped = self.speak_message_q.trim(request.guild, keep, Priority.CHAT)
+            self.dropped.add((request.guild, "message"), len(dropped))
+            logger.info(f"Dropped {len(dropped)} messages in guild {request.guild}")
+        else:
+            self.speak_message_q.put(request.guild, request, len(request.text), Priority.CHAT)
@@ -0,0 +1,94 @@
+from logging import getLogger
+from typing import Optional
+
+import re2 as re
+
+logger = getLogger(__name__)
+
+
+class LiteralReplacer:
+    """
+    Replaces many literal words in one scan.
+    The words are compiled into a single RE2 automaton in leftmost-longest mode:
+    the text is scanned from the start, at each position the longest word starting there is replaced,
+    and the scan continues after it. Replaced text is never scanned again,
+    so replacements do not chain and the order of the words does not matter.
+    """
+    max_mem: int = 64 << 20
+
+    def __init__(self, replacements: dict[str, str]) -> None:
+        """
+        Compile the words.
+        :param replacements: Word and its replacement, empty words are ignored
+        """
+        self.replacements: dict[bytes, bytes] = {
+            before.encode("utf8"): after.encode("utf8") for before, after in replacements.items() if before
+        }
+        self.pattern: Optional[re._Regexp] = None
+        self._trie: Optional[dict] = None
+        if not self.replacements:
+            return
+        options = re.Options()
+        options.longest_match = True
+        options.max_mem = self.max_mem
+        try:
+            self.pattern = re.compile(b"|".join(re.escape(before) for before in self.replacements), options)
+        except re.error as e:
+            # too many words for max_mem, same matching in Python
+            logger.warning(f"Failed to compile {len(self.replacements)} words, falling back to a trie: {e}")
+            self._trie = {}
+            for before, after in self.replacements.items():
+                node = self._trie
+                for byte in before:
+                    node = node.setdefault(byte, {})
+                node[None] = after
+
+    def _lookup(self, match) -> bytes:
+        return self.replacements[match.group()]
+
+    def replace_bytes(self, text: bytes) -> bytes:
+        """
+        Replace the words in UTF-8 text.
+        :param text: UTF-8 text
+        :return: Replaced UTF-8 text
+        """
+        if self.pattern is not None:
+            return self.pattern.sub(self._lookup, text)
+        if self._trie is None:
+            return text
+        result = bytearray()
+        i = 0
+        while i < len(text):
+            node = self._trie.get(text[i])
+            end, after = 0, None
+            j = i
+            while node is not None:
+                j += 1
+                if None in node:
+                    end, after = j, node[None]
+                if j >= len(text):
+                    break
+                node = node.get(text[j])
+            if after is None:
+                result.append(text[i])
+                i += 1
+            else:
+                result += after
+                i = end
+        return bytes(result)
+
+    def replace(self, text: str) -> str:
+        """
+        Replace the words.
+        :param text: Text to be replaced
+        :return: Replaced text
+        """
+        if not self.replacements:
+            return text
+        return self.replace_bytes(text.encode("utf8")).decode("utf8")
+
+    def __bool__(self):
+        return bool(self.replacements)
+
+    def __len__(self):
+        return len(self.replacements)
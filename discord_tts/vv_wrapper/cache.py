@@ -0,0 +1,380 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+from typing import Generic, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+@dataclass
+class CacheStats:
+    """
+    Cache counters
+    """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size: int = 0
+    max_size: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Ratio of hits to lookups
+        :return: hit rate (0.0 - 1.0)
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache(Generic[V]):
+    """
+    Thread safe LRU cache bounded by total size instead of entry count.
+    """
+
+    def __init__(self, max_size: int, sizeof: Callable[[V], int] = len) -> None:
+        """
+        Create the cache.
+        :param max_size: Maximum total size of the values, 0 disables the cache
+        :param sizeof: Function to measure a value, defaults to len (bytes for audio)
+        """
+        self.max_size: int = max_size
+        self.sizeof: Callable[[V], int] = sizeof
+        self._data: OrderedDict[Hashable, tuple[V, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = CacheStats(max_size=max_size)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Get the value and mark it as recently used.
+        :param key: Cache key
+        :return: Cached value or None
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats.hits += 1
+            return item[0]
+
+    def put(self, key: Hashable, value: V, size: Optional[int] = None) -> None:
+        """
+        Store the value, evicting least recently used values to fit.
+        Values larger than max_size are not stored.
+        :param key: Cache key
+        :param value: Value to store
+        :param size: Size charged for the entry, None to measure the value with sizeof
+        :return: None
+        """
+        if size is None:
+            size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._stats.size -= old[1]
+            self._data[key] = (value, size)
+            self._stats.size += size
+            while self._stats.size > self.max_size:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._stats.size -= evicted
+                self._stats.evictions += 1
+            self._stats.entries = len(self._data)
+
+    def pop(self, key: Hashable) -> Optional[V]:
+        """
+        Remove the value.
+        :param key: Cache key
+        :return: Removed value or None
+        """
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return None
+            self._stats.size -= item[1]
+            self._stats.entries = len(self._data)
+            return item[0]
+
+    def clear(self) -> None:
+        """
+        Remove all values. Counters are kept.
+        :return: None
+        """
+        with self._lock:
+            self._data.clear()
+            self._stats.size = 0
+            self._stats.entries = 0
+
+    def stats(self) -> CacheStats:
+        """
+        Get a snapshot of the counters.
+        :return: CacheStats object
+        """
+        with self._lock:
+            return CacheStats(**vars(self._stats))
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def __repr__(self):
+        return f"LRUCache({self._stats.size}/{self.max_size}, {len(self._data)} entries)"
+
+
+class DiskCache:
+    """
+    Persistent audio store shared between restarts and processes.
+    Files are addressed by the digest of the synthesis key, and the index is a
+    SQLite table in WAL mode so several shard processes can use the same directory.
+    A file is renamed into place before its index row is committed,
+    so a crash can leave an orphan file but never a row pointing at a partial file.
+    """
+
+    def __init__(self, directory: str | os.PathLike, max_size: int, policy: str = "lru") -> None:
+        """
+        Open or create the store.
+        :param directory: Directory to store the index and audio files
+        :param max_size: Maximum total size of the stored files
+        :param policy: Compaction policy ("lru" or "lfu")
+        """
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"policy must be lru or lfu, not {policy}")
+        self.directory: str = os.fspath(directory)
+        self.max_size: int = max_size
+        self.policy: str = policy
+        os.makedirs(os.path.join(self.directory, "objects"), exist_ok=True)
+        self._lock = threading.Lock()
+        self._stats = CacheStats(max_size=max_size)
+        self._touched: dict[bytes, int] = {}
+        # separate from _lock so that touch never waits for a read, write or compaction
+        self._touched_lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(self.directory, "index.db"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS blobs "
+            "(digest BLOB PRIMARY KEY, size INTEGER NOT NULL, atime REAL NOT NULL, hits INTEGER NOT NULL) "
+            "WITHOUT ROWID"
+        )
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (id INTEGER PRIMARY KEY, size INTEGER NOT NULL)")
+        self.connection.execute("INSERT OR IGNORE INTO meta (id, size) VALUES (0, 0)")
+        self.sweep()
+
+    @staticmethod
+    def digest(key: Hashable) -> bytes:
+        """
+        Digest of the cache key
+        :param key: Cache key, its repr must be stable between processes
+        :return: 16 bytes digest
+        """
+        return hashlib.blake2b(repr(key).encode("utf8"), digest_size=16).digest()
+
+    def path(self, digest: bytes) -> str:
+        """
+        File path for the digest
+        :param digest: digest of the key
+        :return: path
+        """
+        name = digest.hex()
+        return os.path.join(self.directory, "objects", name[:2], name)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """
+        Read the value and update its access time and hit count.
+        This blocks on SQLite and file I/O, call it off the event loop.
+        :param key: Cache key
+        :return: Stored bytes or None
+        """
+        digest = self.digest(key)
+        with self._lock:
+            row = self.connection.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                self._stats.misses += 1
+                return None
+            try:
+                with open(self.path(digest), "rb") as f:
+                    data = f.read()
+            except (OSError, ValueError):
+                data = None
+            if data is None or len(data) != row[0]:
+                self._remove(digest)
+                self._stats.misses += 1
+                return None
+            self.connection.execute(
+                "UPDATE blobs SET atime = ?, hits = hits + 1 WHERE digest = ?", (time.time(), digest))
+            self._stats.hits += 1
+            return data
+
+    def touch(self, key: Hashable) -> None:
+        """
+        Record a use served from another cache layer.
+        Written to the index in a batch with the next put or compaction.
+        :param key: Cache key
+        :return: None
+        """
+        digest = self.digest(key)
+        with self._touched_lock:
+            self._touched[digest] = self._touched.get(digest, 0) + 1
+
+    def _flush_touched(self) -> None:
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        now = time.time()
+        self.connection.executemany(
+            "UPDATE blobs SET atime = ?, hits = hits + ? WHERE digest = ?",
+            [(now, hits, digest) for digest, hits in touched.items()]
+        )
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        """
+        Store the value and compact the store if it grows over max_size.
+        :param key: Cache key
+        :param value: Bytes to store
+        :return: None
+        """
+        if not value or len(value) > self.max_size:
+            return
+        digest = self.digest(key)
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(value)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_touched()
+                inserted = self.connection.execute(
+                    "INSERT OR IGNORE INTO blobs (digest, size, atime, hits) VALUES (?, ?, ?, 0)",
+                    (digest, len(value), time.time())
+                ).rowcount
+                if inserted:
+                    self.connection.execute("UPDATE meta SET size = size + ? WHERE id = 0", (len(value),))
+                total = self.connection.execute("SELECT size FROM meta WHERE id = 0").fetchone()[0]
+                self.connection.execute("COMMIT")
+            except sqlite3.Error:
+                self.connection.execute("ROLLBACK")
+                raise
+            if total > self.max_size:
+                self._compact(int(self.max_size * 0.9))
+
+    def compact(self, target: Optional[int] = None) -> int:
+        """
+        Remove entries by the policy until the total size is under the target.
+        :param target: Target total size, defaults to 90% of max_size
+        :return: Number of removed entries
+        """
+        with self._lock:
+            return self._compact(int(self.max_size * 0.9) if target is None else target)
+
+    def _compact(self, target: int) -> int:
+        order = "atime" if self.policy == "lru" else "hits, atime"
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._flush_touched()
+            total = self.connection.execute("SELECT size FROM meta WHERE id = 0").fetchone()[0]
+            removed = []
+            for digest, size in self.connection.execute(f"SELECT digest, size FROM blobs ORDER BY {order}"):
+                if total <= target:
+                    break
+                removed.append(digest)
+                total -= size
+            self.connection.executemany("DELETE FROM blobs WHERE digest = ?", [(d,) for d in removed])
+            self.connection.execute("UPDATE meta SET size = ? WHERE id = 0", (total,))
+            self.connection.execute("COMMIT")
+        except sqlite3.Error:
+            self.connection.execute("ROLLBACK")
+            raise
+        for digest in removed:
+            try:
+                os.remove(self.path(digest))
+            except FileNotFoundError:
+                pass
+        self._stats.evictions += len(removed)
+        return len(removed)
+
+    def _remove(self, digest: bytes) -> None:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.connection.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                self.connection.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                self.connection.execute("UPDATE meta SET size = size - ? WHERE id = 0", (row[0],))
+            self.connection.execute("COMMIT")
+        except sqlite3.Error:
+            self.connection.execute("ROLLBACK")
+            raise
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self) -> int:
+        """
+        Remove files left by a crash: temporary files and files without an index row.
+        The total size is recalculated from the index.
+        :return: Number of removed files
+        """
+        removed = 0
+        with self._lock:
+            known = {row[0].hex() for row in self.connection.execute("SELECT digest FROM blobs")}
+            objects = os.path.join(self.directory, "objects")
+            for prefix in os.listdir(objects):
+                for name in os.listdir(os.path.join(objects, prefix)):
+                    if name in known:
+                        continue
+                    path = os.path.join(objects, prefix, name)
+                    # temporary files of other processes may still be written
+                    if name.endswith(".tmp") and time.time() - os.path.getmtime(path) < 60:
+                        continue
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+            self.connection.execute("UPDATE meta SET size = (SELECT COALESCE(SUM(size), 0) FROM blobs) WHERE id = 0")
+        return removed
+
+    def stats(self) -> CacheStats:
+        """
+        Get a snapshot of the counters.
+        entries and size are shared with other processes using the same directory.
+        :return: CacheStats object
+        """
+        with self._lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+            size = self.connection.execute("SELECT size FROM meta WHERE id = 0").fetchone()[0]
+            return CacheStats(
+                self._stats.hits, self._stats.misses, self._stats.evictions, entries, size, self.max_size)
+
+    def close(self) -> None:
+        """
+        Close the index.
+        :return: None
+        """
+        with self._lock:
+            self.connection.close()
+
+    def __repr__(self):
+        return f"DiskCache({self.directory!r}, {self.max_size}, {self.policy!r})"
@@ -1,14 +1,26 @@
+import asyncio
+import io
 import json
 import os
 import subprocess
+import threading
+import time
+import zipfile
+from collections.abc import Coroutine, Hashable
 from dataclasses import dataclass
-from typing import Optional
+from logging import getLogger
+from typing import Any, Optional
 
+import aiohttp
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import HTTPError, MaxRetryError, NewConnectionError
 from vv_wrapper import database as db
+from vv_wrapper.cache import DiskCache, LRUCache
+from vv_wrapper.engine import EnginePool
 
+logger = getLogger(__name__)
 
 if not load_dotenv("../.env"):
     host = "127.0.0.1"
@@ -56,19 +68,52 @@ class Speaker:
 class SpeakersHolder:
     """
     SpeakersHolder class
+    Styles are indexed both ways when the holder is created.
     """
     speakers: list[Speaker]
 
+    def __post_init__(self):
+        self._style_ids: dict[str, int] = {}
+        self._style_names: dict[int, str] = {}
+        self._style_speakers: dict[int, Speaker] = {}
+        for speaker in self.speakers:
+            for name, style_id in speaker.styles_dict().items():
+                self._style_ids[name] = style_id
+                self._style_names[style_id] = name
+                self._style_speakers[style_id] = speaker
+
     def styles(self) -> dict[str, int]:
         """
         Return dict of styles
         speaker_name (style_name): style_id
-        :return: None
+        The returned dict is shared and must not be modified.
+        :return: dict of styles
         """
-        d = {}
-        for speaker in self.speakers:
-            d.update(speaker.styles_dict())
-        return d
+        return self._style_ids
+
+    def style_id(self, name: str) -> Optional[int]:
+        """
+        Get the style id from the name
+        :param name: speaker_name (style_name)
+        :return: style id or None
+        """
+        return self._style_ids.get(name)
+
+    def style_name(self, style_id: int) -> Optional[str]:
+        """
+        Get the name from the style id
+        :param style_id: style id
+        :return: speaker_name (style_name) or None
+        """
+        return self._style_names.get(style_id)
+
+    def speaker(self, style_id: int) -> Optional[Speaker]:
+        """
+        Get the speaker having the style id
+        :param style_id: style id
+        :return: Speaker object or None
+        """
+        return self._style_speakers.get(style_id)
 
 
 class VoiceVox:
@@ -79,11 +124,24 @@ class VoiceVox:
     port: int = 50021
     process = None
     post_phoneme_length = 0.1
+    output_sampling_rate: Optional[int] = None
+    output_stereo: bool = False
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    pool_block: bool = True
+    timeout: tuple[float, float] = (3.0, 30.0)
+    _session: Optional[requests.Session] = None
+    _session_lock = threading.Lock()
+    audio_cache: LRUCache[bytes] = LRUCache(32 * 1024 * 1024)
+    disk_cache: Optional[DiskCache] = None
+    query_cache: LRUCache[bytes] = LRUCache(8 * 1024 * 1024)
+    engines: EnginePool = EnginePool([(host, port)])
 
     @classmethod
     def set_host(cls, host: Optional[str] = None, port: Optional[int] = None) -> None:
         """
         Set host and port
+        Replaces the engine pool with the single engine.
         :param host: VoiceVox Engine host
         :param port: VoiceVox Engine port
         :return: None
@@ -92,6 +150,157 @@ class VoiceVox:
             cls.host = host
         if port is not None:
             cls.port = port
+        cls.engines.set_engines([(cls.host, cls.port)])
+
+    @classmethod
+    def set_engines(cls, endpoints: list[tuple[str, int]]) -> None:
+        """
+        Set the engines to balance requests over
+        :param endpoints: list of (host, port)
+        :return: None
+        """
+        cls.engines.set_engines(endpoints)
+
+    @classmethod
+    def set_pool(
+            cls,
+            pool_connections: Optional[int] = None,
+            pool_maxsize: Optional[int] = None,
+            pool_block: Optional[bool] = None,
+            timeout: Optional[tuple[float, float]] = None
+    ) -> None:
+        """
+        Configure the keep-alive connection pool.
+        The current session is closed and rebuilt on the next request.
+        :param pool_connections: Number of hosts to keep connection pools for
+        :param pool_maxsize: Maximum number of keep-alive connections per host
+        :param pool_block: Whether to wait for a free connection instead of opening an extra one
+        :param timeout: Default (connect, read) timeout in seconds
+        :return: None
+        """
+        if pool_connections is not None:
+            cls.pool_connections = pool_connections
+        if pool_maxsize is not None:
+            cls.pool_maxsize = pool_maxsize
+        if pool_block is not None:
+            cls.pool_block = pool_block
+        if timeout is not None:
+            cls.timeout = timeout
+        cls.close()
+
+    @classmethod
+    def session(cls) -> requests.Session:
+        """
+        Get the shared session, creating it on first use.
+        :return: requests.Session with a keep-alive connection pool
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=cls.pool_connections,
+                    pool_maxsize=cls.pool_maxsize,
+                    pool_block=cls.pool_block
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def close(cls) -> None:
+        """
+        Close the shared session and its pooled connections.
+        :return: None
+        """
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+    @classmethod
+    def set_audio_cache(cls, max_bytes: int) -> None:
+        """
+        Replace the synthesized audio cache
+        :param max_bytes: Maximum total size of cached audio, 0 disables the cache
+        :return: None
+        """
+        cls.audio_cache = LRUCache(max_bytes)
+
+    @classmethod
+    def set_query_cache(cls, max_bytes: int) -> None:
+        """
+        Replace the AudioQuery cache
+        :param max_bytes: Maximum total size of cached AudioQuery json, 0 disables the cache
+        :return: None
+        """
+        cls.query_cache = LRUCache(max_bytes)
+
+    @classmethod
+    def set_disk_cache(
+            cls,
+            directory: Optional[str | os.PathLike],
+            max_bytes: int = 1024 * 1024 * 1024,
+            policy: str = "lru"
+    ) -> None:
+        """
+        Set the persistent audio cache
+        :param directory: Directory of the store, None disables the cache
+        :param max_bytes: Maximum total size of stored audio
+        :param policy: Compaction policy ("lru" or "lfu")
+        :return: None
+        """
+        if cls.disk_cache is not None:
+            cls.disk_cache.close()
+        cls.disk_cache = DiskCache(directory, max_bytes, policy) if directory else None
+
+    @classmethod
+    def cached_audio(cls, key: tuple) -> Optional[bytes]:
+        """
+        Look up the audio in the memory cache, then in the disk cache
+        :param key: Key from cache_key
+        :return: Synthesized audio bytes or None
+        """
+        wav = cls.audio_cache.get(key)
+        if cls.disk_cache is not None:
+            if wav is None:
+                wav = cls.disk_cache.get(key)
+                if wav is not None:
+                    cls.audio_cache.put(key, wav)
+            else:
+                cls.disk_cache.touch(key)
+        return wav
+
+    @classmethod
+    def store_audio(cls, key: tuple, wav: bytes) -> None:
+        """
+        Store the audio in the memory cache and the disk cache
+        :param key: Key from cache_key
+        :param wav: Synthesized audio bytes
+        :return: None
+        """
+        cls.audio_cache.put(key, wav)
+        if cls.disk_cache is not None:
+            cls.disk_cache.put(key, wav)
+
+    @classmethod
+    def cache_key(
+            cls,
+            text: str,
+            speaker: int,
+            speed: float,
+            pitch: float,
+            intonation: float,
+            volume: float
+    ) -> tuple:
+        """
+        Key of the synthesized audio in the caches
+        :return: tuple of the text and every parameter affecting the audio
+        """
+        return (
+            text, speaker, speed, pitch, intonation, volume,
+            cls.post_phoneme_length, cls.output_sampling_rate, cls.output_stereo
+        )
 
     @classmethod
     def set_post_phoneme_length(cls, length: float) -> None:
@@ -104,6 +313,20 @@ class VoiceVox:
             raise ValueError("post phoneme length must be between 0.0 and 1.50")
         cls.post_phoneme_length = length
 
+    @classmethod
+    def set_output_format(cls, sampling_rate: Optional[int] = None, stereo: bool = False) -> None:
+        """
+        Set the format the engine outputs.
+        Requesting 48000Hz stereo lets the player skip resampling, at the cost of 4 times larger audio.
+        :param sampling_rate: Sampling rate, None to use the engine default (24000Hz)
+        :param stereo: Whether to output stereo
+        :return: None
+        """
+        if sampling_rate is not None and not (8000 <= sampling_rate <= 96000):
+            raise ValueError("sampling rate must be between 8000 and 96000")
+        cls.output_sampling_rate = sampling_rate
+        cls.output_stereo = stereo
+
     @classmethod
     def synth_from_settings(cls, text: str, settings: db.BaseSetting) -> bytes:
         return cls.synthesize(
@@ -135,6 +358,78 @@ class VoiceVox:
         :param volume: Volume
         :return: Synthesized audio bytes (.wav format)
         """
+        cls.check_params(speed, pitch, intonation, volume)
+        key = cls.cache_key(text, speaker, speed, pitch, intonation, volume)
+        wav = cls.cached_audio(key)
+        if wav is not None:
+            return wav
+        query = cls.audio_query(text, speaker)
+        cls.apply_params(query, speed, pitch, intonation, volume)
+        wav = cls.synthesis(query, speaker)
+        cls.store_audio(key, wav)
+        return wav
+
+    @classmethod
+    def synth_many_from_settings(cls, texts: list[str], settings: db.BaseSetting) -> list[bytes]:
+        return cls.synthesize_many(
+            texts,
+            settings.speaker,
+            settings.speed,
+            settings.pitch,
+            settings.intonation,
+            settings.volume
+        )
+
+    @classmethod
+    def synthesize_many(
+            cls,
+            texts: list[str],
+            speaker: int = 3,
+            speed: float = 1.0,
+            pitch: float = 0.0,
+            intonation: float = 1.0,
+            volume: float = 1.0,
+    ) -> list[bytes]:
+        """
+        Synthesize the texts with one /multi_synthesis request
+        Cached clips are not synthesized again.
+        :param texts: Texts to synthesize
+        :param speaker: Speaker id
+        :param speed: Speed
+        :param pitch: Pitch
+        :param intonation: Intonation
+        :param volume: Volume
+        :return: Synthesized audio bytes (.wav format) in the order of texts
+        """
+        cls.check_params(speed, pitch, intonation, volume)
+        keys = [cls.cache_key(text, speaker, speed, pitch, intonation, volume) for text in texts]
+        wavs = [cls.cached_audio(key) for key in keys]
+        missing = [i for i, wav in enumerate(wavs) if wav is None]
+        if not missing:
+            return wavs
+        queries = [
+            cls.apply_params(cls.audio_query(texts[i], speaker), speed, pitch, intonation, volume) for i in missing
+        ]
+        if len(queries) == 1:
+            synthesized = [cls.synthesis(queries[0], speaker)]
+        else:
+            synthesized = cls.multi_synthesis(queries, speaker)
+        for i, wav in zip(missing, synthesized):
+            wavs[i] = wav
+            cls.store_audio(keys[i], wav)
+        return wavs
+
+    @staticmethod
+    def check_params(speed: float, pitch: float, intonation: float, volume: float) -> None:
+        """
+        Validate the voice parameters
+        :param speed: Speed
+        :param pitch: Pitch
+        :param intonation: Intonation
+        :param volume: Volume
+        :return: None
+        :raises ValueError: parameter is out of range
+        """
         if not (0.5 <= speed <= 2.0):
             raise ValueError("Speed must be between 0.5 and 2.0")
         if not (-0.15 <= pitch <= 0.15):
@@ -144,31 +439,117 @@ class VoiceVox:
         if not (0.0 <= volume <= 2.0):
             raise ValueError("Volume must be between 0.0 and 2.0")
 
-        params = (('text', text), ('speaker', speaker))
-
-        query = requests.post(
-            f'http://{cls.host}:{cls.port}/audio_query',
-            params=params
-        )
+    @classmethod
+    def apply_params(
+            cls,
+            query: dict,
+            speed: float = 1.0,
+            pitch: float = 0.0,
+            intonation: float = 1.0,
+            volume: float = 1.0,
+    ) -> dict:
+        """
+        Apply the voice parameters to the AudioQuery
+        :param query: AudioQuery json, modified in place
+        :param speed: Speed
+        :param pitch: Pitch
+        :param intonation: Intonation
+        :param volume: Volume
+        :return: AudioQuery json
+        """
+        query["speedScale"] = speed
+        query["pitchScale"] = pitch
+        query["intonationScale"] = intonation
+        query["volumeScale"] = volume
+        query["prePhonemeLength"] = 0.0
+        query["postPhonemeLength"] = cls.post_phoneme_length
+        query["outputStereo"] = cls.output_stereo
+        if cls.output_sampling_rate is not None:
+            query["outputSamplingRate"] = cls.output_sampling_rate
+        return query
 
-        query_json = query.json()
-        query_json["speedScale"] = speed
-        query_json["pitchScale"] = pitch
-        query_json["intonationScale"] = intonation
-        query_json["volumeScale"] = volume
-        query_json["prePhonemeLength"] = 0.0
-        query_json["postPhonemeLength"] = cls.post_phoneme_length
-        query_json["outputStereo"] = False
-
-        synthesis = requests.post(
-            f'http://{host}:{port}/synthesis',
-            headers={"Content-Type": "application/json"},
-            params=params,
-            data=json.dumps(query_json)
-        )
+    @classmethod
+    def audio_query(cls, text: str, speaker: int, timeout: Optional[tuple[float, float]] = None) -> dict:
+        """
+        Create the AudioQuery for the text
+        :param text: Text to synthesize
+        :param speaker: Speaker id
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: AudioQuery json, a new object on every call
+        """
+        raw = cls.query_cache.get((text, speaker))
+        if raw is None:
+            with cls.engines.acquire() as engine:
+                query = cls.session().post(
+                    engine.url("/audio_query"),
+                    params={"text": text, "speaker": speaker},
+                    timeout=timeout or cls.timeout
+                )
+                query.raise_for_status()
+            raw = query.content
+            cls.query_cache.put((text, speaker), raw)
+        return json.loads(raw)
 
+    @classmethod
+    def synthesis(cls, query: dict, speaker: int, timeout: Optional[tuple[float, float]] = None) -> bytes:
+        """
+        Synthesize the AudioQuery
+        :param query: AudioQuery json
+        :param speaker: Speaker id
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: Synthesized audio bytes (.wav format)
+        """
+        with cls.engines.acquire() as engine:
+            synthesis = cls.session().post(
+                engine.url("/synthesis"),
+                headers={"Content-Type": "application/json"},
+                params={"speaker": speaker},
+                data=json.dumps(query),
+                timeout=timeout or cls.timeout
+            )
+            synthesis.raise_for_status()
         return synthesis.content
 
+    @classmethod
+    def multi_synthesis(
+            cls,
+            queries: list[dict],
+            speaker: int,
+            timeout: Optional[tuple[float, float]] = None
+    ) -> list[bytes]:
+        """
+        Synthesize the AudioQueries with one request
+        :param queries: AudioQuery json list
+        :param speaker: Speaker id
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: Synthesized audio bytes (.wav format) in the order of queries
+        """
+        with cls.engines.acquire() as engine:
+            synthesis = cls.session().post(
+                engine.url("/multi_synthesis"),
+                headers={"Content-Type": "application/json"},
+                params={"speaker": speaker},
+                data=json.dumps(queries),
+                timeout=timeout or cls.timeout
+            )
+            synthesis.raise_for_status()
+        return cls.unpack_multi_synthesis(synthesis.content, len(queries))
+
+    @staticmethod
+    def unpack_multi_synthesis(content: bytes, count: int) -> list[bytes]:
+        """
+        Extract the clips from /multi_synthesis response
+        :param content: zip archive of "001.wav", "002.wav", ...
+        :param count: Number of queries sent
+        :return: Synthesized audio bytes in the order of queries
+        :raises ValueError: the archive does not contain one clip per query
+        """
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            names = sorted(name for name in archive.namelist() if name.endswith(".wav"))
+            if len(names) != count:
+                raise ValueError(f"multi_synthesis returned {len(names)} clips for {count} queries")
+            return [archive.read(name) for name in names]
+
     @classmethod
     def get_speakers_raw(cls) -> dict:
         """
@@ -177,7 +558,8 @@ class VoiceVox:
         :raises ConnectionError: VoiceVox Engine is not running
         """
         try:
-            ret = requests.get(f'http://{cls.host}:{cls.port}/speakers')
+            with cls.engines.acquire() as engine:
+                ret = cls.session().get(engine.url("/speakers"), timeout=cls.timeout)
         except (HTTPError, OSError, ConnectionError, IOError, MaxRetryError, NewConnectionError, ConnectionRefusedError) as e:
             raise RuntimeError("VoiceVox Engine is not running") from e
         return ret.json()
@@ -188,8 +570,17 @@ class VoiceVox:
         Get all usable speakers
         :return: SpeakersHolder object
         """
+        return cls.parse_speakers(cls.get_speakers_raw())
+
+    @staticmethod
+    def parse_speakers(raw: list[dict]) -> SpeakersHolder:
+        """
+        Build SpeakersHolder from /speakers response
+        :param raw: Response json
+        :return: SpeakersHolder object
+        """
         speakers = []
-        for s in cls.get_speakers_raw():
+        for s in raw:
             styles = [SpeakerStyle(i["id"], i["name"], i["type"]) for i in s["styles"]]
             speakers.append(
                 Speaker(s["name"], s["speaker_uuid"], styles)
@@ -204,5 +595,405 @@ class VoiceVox:
         :return: dict of speaker data
         """
         query = {"speaker_uuid": speaker_uuid}
-        ret = requests.get(f'http://{cls.host}:{cls.port}/speaker_info', params=query)
+        with cls.engines.acquire() as engine:
+            ret = cls.session().get(engine.url("/speaker_info"), params=query, timeout=cls.timeout)
         return ret.json()
+
+
+class AsyncVoiceVox:
+    """
+    asyncio VoiceVox wrapper class
+    Shares engines, timeout, post phoneme length and caches with VoiceVox.
+    Requests started with create_task can be cancelled while in flight.
+    """
+    limit: int = 64
+    limit_per_host: int = 16
+    keepalive_timeout: float = 30.0
+    _session: Optional[aiohttp.ClientSession] = None
+    _tasks: dict[Hashable, set[asyncio.Task]] = {}
+
+    @classmethod
+    async def set_pool(
+            cls,
+            limit: Optional[int] = None,
+            limit_per_host: Optional[int] = None,
+            keepalive_timeout: Optional[float] = None
+    ) -> None:
+        """
+        Configure the keep-alive connection pool.
+        The current session is closed and rebuilt on the next request.
+        :param limit: Maximum number of connections in total
+        :param limit_per_host: Maximum number of connections per engine
+        :param keepalive_timeout: Seconds to keep idle connections open
+        :return: None
+        """
+        if limit is not None:
+            cls.limit = limit
+        if limit_per_host is not None:
+            cls.limit_per_host = limit_per_host
+        if keepalive_timeout is not None:
+            cls.keepalive_timeout = keepalive_timeout
+        await cls.close()
+
+    @classmethod
+    def session(cls) -> aiohttp.ClientSession:
+        """
+        Get the shared session, creating it on first use.
+        Must be called from the running event loop.
+        :return: aiohttp.ClientSession with a keep-alive connection pool
+        """
+        if cls._session is None or cls._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=cls.limit,
+                limit_per_host=cls.limit_per_host,
+                keepalive_timeout=cls.keepalive_timeout
+            )
+            cls._session = aiohttp.ClientSession(connector=connector)
+        return cls._session
+
+    @classmethod
+    async def close(cls) -> None:
+        """
+        Close the shared session and its pooled connections.
+        :return: None
+        """
+        if cls._session is not None:
+            await cls._session.close()
+            cls._session = None
+
+    @staticmethod
+    async def cached_audio(key: tuple) -> Optional[bytes]:
+        """
+        Look up the audio in the memory cache, then in the disk cache off the event loop
+        :param key: Key from VoiceVox.cache_key
+        :return: Synthesized audio bytes or None
+        """
+        wav = VoiceVox.audio_cache.get(key)
+        disk_cache = VoiceVox.disk_cache
+        if disk_cache is None:
+            return wav
+        if wav is not None:
+            disk_cache.touch(key)
+            return wav
+        wav = await asyncio.to_thread(disk_cache.get, key)
+        if wav is not None:
+            VoiceVox.audio_cache.put(key, wav)
+        return wav
+
+    @staticmethod
+    async def store_audio(key: tuple, wav: bytes) -> None:
+        """
+        Store the audio in the caches, writing the disk cache off the event loop
+        :param key: Key from VoiceVox.cache_key
+        :param wav: Synthesized audio bytes
+        :return: None
+        """
+        VoiceVox.audio_cache.put(key, wav)
+        if VoiceVox.disk_cache is not None:
+            await asyncio.to_thread(VoiceVox.disk_cache.put, key, wav)
+
+    @staticmethod
+    def client_timeout(timeout: Optional[tuple[float, float]] = None) -> aiohttp.ClientTimeout:
+        """
+        Convert (connect, read) timeout to aiohttp.ClientTimeout
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: aiohttp.ClientTimeout
+        """
+        connect, read = timeout or VoiceVox.timeout
+        return aiohttp.ClientTimeout(connect=connect, sock_read=read)
+
+    @classmethod
+    def create_task(cls, coro: Coroutine[Any, Any, Any], tag: Hashable = None) -> asyncio.Task:
+        """
+        Run the request as a task that can be cancelled with cancel.
+        :param coro: Coroutine such as AsyncVoiceVox.synthesize(...)
+        :param tag: Key to group tasks, such as a guild id
+        :return: asyncio.Task
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        cls._tasks.setdefault(tag, set()).add(task)
+        task.add_done_callback(lambda t: cls._forget(tag, t))
+        return task
+
+    @classmethod
+    def _forget(cls, tag: Hashable, task: asyncio.Task) -> None:
+        tasks = cls._tasks.get(tag)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                cls._tasks.pop(tag, None)
+
+    @classmethod
+    def cancel(cls, tag: Hashable = None) -> int:
+        """
+        Cancel the in-flight requests started with the tag.
+        :param tag: Key passed to create_task
+        :return: Number of cancelled tasks
+        """
+        count = 0
+        for task in list(cls._tasks.get(tag, ())):
+            if task.cancel():
+                count += 1
+        return count
+
+    @classmethod
+    async def synth_from_settings(cls, text: str, settings: db.BaseSetting) -> bytes:
+        return await cls.synthesize(
+            text,
+            settings.speaker,
+            settings.speed,
+            settings.pitch,
+            settings.intonation,
+            settings.volume
+        )
+
+    @classmethod
+    async def synthesize(
+            cls,
+            text: str,
+            speaker: int = 3,
+            speed: float = 1.0,
+            pitch: float = 0.0,
+            intonation: float = 1.0,
+            volume: float = 1.0,
+    ) -> bytes:
+        """
+        Synthesize the text
+        :param text: Text to synthesize
+        :param speaker: Speaker id
+        :param speed: Speed
+        :param pitch: Pitch
+        :param intonation: Intonation
+        :param volume: Volume
+        :return: Synthesized audio bytes (.wav format)
+        """
+        VoiceVox.check_params(speed, pitch, intonation, volume)
+        key = VoiceVox.cache_key(text, speaker, speed, pitch, intonation, volume)
+        wav = await cls.cached_audio(key)
+        if wav is not None:
+            return wav
+        query = await cls.audio_query(text, speaker)
+        VoiceVox.apply_params(query, speed, pitch, intonation, volume)
+        wav = await cls.synthesis(query, speaker)
+        await cls.store_audio(key, wav)
+        return wav
+
+    @classmethod
+    async def synth_many_from_settings(cls, texts: list[str], settings: db.BaseSetting) -> list[bytes]:
+        return await cls.synthesize_many(
+            texts,
+            settings.speaker,
+            settings.speed,
+            settings.pitch,
+            settings.intonation,
+            settings.volume
+        )
+
+    @classmethod
+    async def synthesize_many(
+            cls,
+            texts: list[str],
+            speaker: int = 3,
+            speed: float = 1.0,
+            pitch: float = 0.0,
+            intonation: float = 1.0,
+            volume: float = 1.0,
+    ) -> list[bytes]:
+        """
+        Synthesize the texts with one /multi_synthesis request
+        Cached clips are not synthesized again.
+        :param texts: Texts to synthesize
+        :param speaker: Speaker id
+        :param speed: Speed
+        :param pitch: Pitch
+        :param intonation: Intonation
+        :param volume: Volume
+        :return: Synthesized audio bytes (.wav format) in the order of texts
+        """
+        VoiceVox.check_params(speed, pitch, intonation, volume)
+        keys = [VoiceVox.cache_key(text, speaker, speed, pitch, intonation, volume) for text in texts]
+        wavs = list(await asyncio.gather(*(cls.cached_audio(key) for key in keys)))
+        missing = [i for i, wav in enumerate(wavs) if wav is None]
+        if not missing:
+            return wavs
+        queries = await asyncio.gather(*(cls.audio_query(texts[i], speaker) for i in missing))
+        for query in queries:
+            VoiceVox.apply_params(query, speed, pitch, intonation, volume)
+        if len(queries) == 1:
+            synthesized = [await cls.synthesis(queries[0], speaker)]
+        else:
+            synthesized = await cls.multi_synthesis(queries, speaker)
+        for i, wav in zip(missing, synthesized):
+            wavs[i] = wav
+            await cls.store_audio(keys[i], wav)
+        return wavs
+
+    @classmethod
+    async def audio_query(cls, text: str, speaker: int, timeout: Optional[tuple[float, float]] = None) -> dict:
+        """
+        Create the AudioQuery for the text
+        :param text: Text to synthesize
+        :param speaker: Speaker id
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: AudioQuery json, a new object on every call
+        """
+        raw = VoiceVox.query_cache.get((text, speaker))
+        if raw is None:
+            with VoiceVox.engines.acquire() as engine:
+                async with cls.session().post(
+                    engine.url("/audio_query"),
+                    params={"text": text, "speaker": speaker},
+                    timeout=cls.client_timeout(timeout)
+                ) as query:
+                    query.raise_for_status()
+                    raw = await query.read()
+            VoiceVox.query_cache.put((text, speaker), raw)
+        return json.loads(raw)
+
+    @classmethod
+    async def synthesis(cls, query: dict, speaker: int, timeout: Optional[tuple[float, float]] = None) -> bytes:
+        """
+        Synthesize the AudioQuery
+        :param query: AudioQuery json
+        :param speaker: Speaker id
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: Synthesized audio bytes (.wav format)
+        """
+        with VoiceVox.engines.acquire() as engine:
+            async with cls.session().post(
+                engine.url("/synthesis"),
+                headers={"Content-Type": "application/json"},
+                params={"speaker": speaker},
+                data=json.dumps(query),
+                timeout=cls.client_timeout(timeout)
+            ) as synthesis:
+                synthesis.raise_for_status()
+                return await synthesis.read()
+
+    @classmethod
+    async def multi_synthesis(
+            cls,
+            queries: list[dict],
+            speaker: int,
+            timeout: Optional[tuple[float, float]] = None
+    ) -> list[bytes]:
+        """
+        Synthesize the AudioQueries with one request
+        :param queries: AudioQuery json list
+        :param speaker: Speaker id
+        :param timeout: (connect, read) timeout, defaults to VoiceVox.timeout
+        :return: Synthesized audio bytes (.wav format) in the order of queries
+        """
+        with VoiceVox.engines.acquire() as engine:
+            async with cls.session().post(
+                engine.url("/multi_synthesis"),
+                headers={"Content-Type": "application/json"},
+                params={"speaker": speaker},
+                data=json.dumps(queries),
+                timeout=cls.client_timeout(timeout)
+            ) as synthesis:
+                synthesis.raise_for_status()
+                content = await synthesis.read()
+        return VoiceVox.unpack_multi_synthesis(content, len(queries))
+
+    @classmethod
+    async def get_speakers_raw(cls) -> list[dict]:
+        """
+        Get speakers raw data
+        :return: Response json
+        :raises RuntimeError: VoiceVox Engine is not running
+        """
+        try:
+            with VoiceVox.engines.acquire() as engine:
+                async with cls.session().get(engine.url("/speakers"), timeout=cls.client_timeout()) as ret:
+                    return await ret.json()
+        except (aiohttp.ClientError, OSError) as e:
+            raise RuntimeError("VoiceVox Engine is not running") from e
+
+    @classmethod
+    async def get_speakers(cls) -> SpeakersHolder:
+        """
+        Get all usable speakers
+        :return: SpeakersHolder object
+        """
+        return VoiceVox.parse_speakers(await cls.get_speakers_raw())
+
+    @classmethod
+    async def speakerdata(cls, speaker_uuid: str) -> dict[str, str | list | dict]:
+        """
+        Get speaker data
+        :param speaker_uuid: UUID of the speaker
+        :return: dict of speaker data
+        """
+        query = {"speaker_uuid": speaker_uuid}
+        with VoiceVox.engines.acquire() as engine:
+            async with cls.session().get(
+                engine.url("/speaker_info"), params=query, timeout=cls.client_timeout()
+            ) as ret:
+                return await ret.json()
+
+
+class SpeakerCatalogue:
+    """
+    Cached speaker list
+    Loaded once and refreshed after ttl seconds or on invalidate.
+    If a refresh fails, the previous list keeps being served.
+    """
+
+    def __init__(self, ttl: float = 600.0) -> None:
+        """
+        Create the catalogue.
+        :param ttl: Seconds before the list is fetched again
+        """
+        self.ttl: float = ttl
+        self._holder: Optional[SpeakersHolder] = None
+        self._loaded_at: float = 0.0
+        self._invalid: bool = False
+
+    @property
+    def stale(self) -> bool:
+        return self._holder is None or self._invalid or time.monotonic() - self._loaded_at > self.ttl
+
+    def get(self) -> SpeakersHolder:
+        """
+        Get the speakers, fetching them if stale.
+        :return: SpeakersHolder object
+        :raises RuntimeError: VoiceVox Engine is not running and nothing is cached
+        """
+        if self.stale:
+            try:
+                self._set(VoiceVox.get_speakers())
+            except RuntimeError:
+                if self._holder is None:
+                    raise
+                logger.warning("Failed to refresh the speakers, using the cached list")
+                self._set(self._holder)
+        return self._holder
+
+    async def aget(self) -> SpeakersHolder:
+        """
+        Get the speakers without blocking the event loop, fetching them if stale.
+        :return: SpeakersHolder object
+        :raises RuntimeError: VoiceVox Engine is not running and nothing is cached
+        """
+        if self.stale:
+            try:
+                self._set(await AsyncVoiceVox.get_speakers())
+            except RuntimeError:
+                if self._holder is None:
+                    raise
+                logger.warning("Failed to refresh the speakers, using the cached list")
+                self._set(self._holder)
+        return self._holder
+
+    def invalidate(self) -> None:
+        """
+        Fetch the speakers again on the next access.
+        :return: None
+        """
+        self._invalid = True
+
+    def _set(self, holder: SpeakersHolder) -> None:
+        self._holder = holder
+        self._loaded_at = time.monotonic()
+        self._invalid = False
@@ -1,5 +1,7 @@
+import itertools
 import os
 import sqlite3
+import threading
 from dataclasses import dataclass
 from json import loads
 from typing import Optional
@@ -7,6 +9,8 @@ from urllib.parse import urlparse
 
 import re2 as re
 
+from vv_wrapper.automaton import LiteralReplacer
+
 
 class SQLiteWrapper:
     def __init__(self, database: str | os.PathLike) -> None:
@@ -62,6 +66,18 @@ class Replacer:
     code_block_pattern = re.compile(r'(?s)```.*?```'.encode("utf8"))
     custom_emoji_pattern = re.compile(r'<a?:[a-zA-Z0-9_]+:[0-9]+>'.encode("utf8"))
     sound_emoji_pattern = re.compile(r'<sound:[0-9]+:[0-9]+>'.encode("utf8"))
+    # one capturing group per branch, in the order they are tried at the same position
+    builtin_branches: tuple[tuple[str, bytes], ...] = (
+        ("code_block", rb'(?s:(```.*?```))'),
+        # the character after :// must start a netloc, as urlparse requires
+        ("url", rb'(https?://(?:[a-zA-Z0-9]|[$-.0->@-_]|[!*\\(),]|%[0-9a-fA-F][0-9a-fA-F])'
+                rb'(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(),]|%[0-9a-fA-F][0-9a-fA-F])*)'),
+        ("custom_emoji", rb'<a?:([a-zA-Z0-9_]+):[0-9]+>'),
+        ("sound_emoji", rb'(<sound:[0-9]+:[0-9]+>)'),
+    )
+    _builtin_patterns: dict[tuple[bool, bool], tuple[re._Regexp, tuple[str, ...]]] = {}
+    # shared by every replacer so that a version identifies one set of replacements
+    _versions = itertools.count(1)
 
     def __init__(self, regex_replacements: dict[str, str], simple_replacements: dict[str, str]) -> None:
         """
@@ -69,9 +85,8 @@ class Replacer:
         :param regex_replacements: Regex replacements
         :param simple_replacements: Simple replacements
         """
-        self.regex_replacements_str: dict[str, str] = regex_replacements
-        self.regex_replacements: dict[re._Regexp, str] = {re.compile(k.encode("utf-8")): v for k, v in regex_replacements.items()}
-        self.simple_replacements: dict[str, str] = simple_replacements
+        self._lock = threading.Lock()
+        self.update_replacements(regex_replacements, simple_replacements)
 
     def replace(
             self,
@@ -82,35 +97,242 @@ class Replacer:
     ) -> str:
         """
         Replace the text.
+        Simple replacements are applied in one scan, taking the longest word at each position.
+        The result of a simple replacement is not replaced again by another one.
         :param text: Text to be replaced
         :param url_replacement: Replacement for URLs
         :param code_block_replacement: Replacement for code blocks
         :return: Replaced text
         """
-        # 正規表現を使用する置換を一括で実行
-        for before, after in self.regex_replacements.items():
-            text = before.sub(after.encode("utf8"), text.encode("utf8")).decode("utf8")
-        # 正規表現を使用しない置換を実行
-        for before, after in self.simple_replacements.items():
-            text = text.replace(before, after)
-        if url_replacement:
-            text = self.replace_urls(text, url_replacement)
-        if code_block_replacement:
-            text = self.replace_code_blocks(text, code_block_replacement)
-        text = self.replace_custom_emoji(text)
-        text = self.replace_sound_moji(text)
-        return text
+        data = text.encode("utf8")
+        with self._lock:
+            if self._dirty:
+                self._build()
+            # 正規表現を使用する置換を一括で実行
+            data = self.replace_regex(data)
+            # 正規表現を使用しない置換を一度の走査で実行
+            data = self.simple_replacer.replace_bytes(data)
+        # URL、コードブロック、絵文字の置換を一度の走査で実行
+        data = self.replace_builtin(data, url_replacement, code_block_replacement)
+        return data.decode("utf8")
 
     def update_replacements(self, regex_replacements: dict[str, str], simple_replacements: dict[str, str]) -> None:
         """
-        Update the replacements.
+        Replace every replacement and compile them all.
         :param regex_replacements: New regex replacements
         :param simple_replacements: New simple replacements
         :return: None
         """
-        self.regex_replacements_str: dict[str, str] = regex_replacements
-        self.regex_replacements: dict[re._Regexp, str] = {re.compile(k.encode("utf8")): v for k, v in regex_replacements.items()}
-        self.simple_replacements: dict[str, str] = simple_replacements
+        compiled = {k: re.compile(k.encode("utf8")) for k in regex_replacements}
+        with self._lock:
+            self.regex_replacements_str: dict[str, str] = dict(regex_replacements)
+            self.simple_replacements: dict[str, str] = dict(simple_replacements)
+            self._compiled: dict[str, re._Regexp] = compiled
+            self._build()
+            self.version: int = next(self._versions)
+
+    def _build(self) -> None:
+        """
+        Rebuild the structures used by replace from the replacements.
+        Regex patterns are compiled when they are added, only the set and the literal automaton are compiled here.
+        Called with the lock held.
+        :return: None
+        """
+        self.regex_replacements: dict[re._Regexp, str] = {
+            self._compiled[k]: v for k, v in self.regex_replacements_str.items()
+        }
+        # pattern and pre-encoded replacement in dictionary order
+        self.regex_pipeline: list[tuple[re._Regexp, bytes]] = [
+            (pattern, after.encode("utf8")) for pattern, after in self.regex_replacements.items()
+        ]
+        self.regex_set: Optional[re.Set] = self.compile_set(list(self.regex_replacements_str))
+        self.simple_replacer: LiteralReplacer = LiteralReplacer(self.simple_replacements)
+        self._dirty: bool = False
+
+    def _changed(self) -> None:
+        """
+        Mark the compiled structures stale and give the replacements a new version.
+        Called with the lock held.
+        :return: None
+        """
+        self._dirty = True
+        self.version = next(self._versions)
+
+    def add(self, before: str, after: str, use_regex: bool = False) -> None:
+        """
+        Add or overwrite a replacement.
+        Only the new pattern is compiled now, the rest is rebuilt on the next replace.
+        :param before: Text or regex to be replaced
+        :param after: Replacement text
+        :param use_regex: Whether before is a regex
+        :return: None
+        :raises re.error: The regex is invalid
+        """
+        pattern = re.compile(before.encode("utf8")) if use_regex else None
+        with self._lock:
+            self._discard(before)
+            if use_regex:
+                self._compiled[before] = pattern
+                self.regex_replacements_str[before] = after
+            else:
+                self.simple_replacements[before] = after
+            self._changed()
+
+    def remove(self, before: str) -> bool:
+        """
+        Remove a replacement.
+        :param before: Text or regex to be replaced
+        :return: True if it was removed, False if it did not exist
+        """
+        with self._lock:
+            removed = self._discard(before)
+            if removed:
+                self._changed()
+            return removed
+
+    def rename(self, old_before: str, new_before: str, after: str, use_regex: bool = False) -> bool:
+        """
+        Change a replacement keeping its position, so regex replacements are applied in the same order as before.
+        :param old_before: Text or regex to be replaced now
+        :param new_before: New text or regex
+        :param after: Replacement text
+        :param use_regex: Whether new_before is a regex
+        :return: True if changed, False if old_before is not a replacement of the same kind
+        :raises re.error: The regex is invalid
+        """
+        replacements = self.regex_replacements_str if use_regex else self.simple_replacements
+        pattern = re.compile(new_before.encode("utf8")) if use_regex else None
+        with self._lock:
+            if old_before not in replacements:
+                return False
+            if new_before != old_before:
+                self._discard(new_before)
+            items = [
+                (new_before, after) if k == old_before else (k, v) for k, v in replacements.items()
+            ]
+            replacements.clear()
+            replacements.update(items)
+            if use_regex:
+                self._compiled.pop(old_before, None)
+                self._compiled[new_before] = pattern
+            self._changed()
+            return True
+
+    def _discard(self, before: str) -> bool:
+        """
+        Remove a replacement without marking the replacer changed.
+        Called with the lock held.
+        :param before: Text or regex to be replaced
+        :return: True if it existed
+        """
+        if before in self.regex_replacements_str:
+            del self.regex_replacements_str[before]
+            del self._compiled[before]
+            return True
+        if before in self.simple_replacements:
+            del self.simple_replacements[before]
+            return True
+        return False
+
+    @staticmethod
+    def compile_set(patterns: list[str]) -> Optional[re.Set]:
+        """
+        Compile the patterns into a set to find which of them can match in one search.
+        :param patterns: Regex patterns
+        :return: Compiled set, None if there are no patterns or the set can not be compiled
+        """
+        if not patterns:
+            return None
+        regex_set = re.Set.SearchSet(re.Options())
+        try:
+            for pattern in patterns:
+                regex_set.Add(pattern.encode("utf8"))
+            regex_set.Compile()
+        except re.error:
+            return None
+        return regex_set
+
+    def replace_regex(self, data: bytes) -> bytes:
+        """
+        Apply the regex replacements in order to UTF-8 text.
+        Patterns the set reports as not matching are skipped,
+        and the set is searched again only after a replacement changes the text.
+        :param data: UTF-8 text
+        :return: Replaced UTF-8 text
+        """
+        if not self.regex_pipeline:
+            return data
+        if self.regex_set is None:
+            for pattern, after in self.regex_pipeline:
+                data = pattern.sub(after, data)
+            return data
+        candidates = self.regex_set.Match(data)
+        if not candidates:
+            return data
+        candidates = set(candidates)
+        for i, (pattern, after) in enumerate(self.regex_pipeline):
+            if i not in candidates:
+                continue
+            replaced = pattern.sub(after, data)
+            if replaced != data:
+                data = replaced
+                candidates = set(self.regex_set.Match(data) or ())
+        return data
+
+    @classmethod
+    def builtin_pattern(cls, urls: bool, code_blocks: bool) -> tuple[re._Regexp, tuple[str, ...]]:
+        """
+        Get the combined pattern of the built-in replacements.
+        :param urls: Whether to match URLs
+        :param code_blocks: Whether to match code blocks
+        :return: Compiled pattern and the kind of each capturing group
+        """
+        key = (urls, code_blocks)
+        if key not in cls._builtin_patterns:
+            branches = [
+                (kind, branch) for kind, branch in cls.builtin_branches
+                if (kind != "url" or urls) and (kind != "code_block" or code_blocks)
+            ]
+            cls._builtin_patterns[key] = (
+                re.compile(b"|".join(branch for _, branch in branches)),
+                tuple(kind for kind, _ in branches)
+            )
+        return cls._builtin_patterns[key]
+
+    @classmethod
+    def replace_builtin(
+            cls,
+            data: bytes,
+            url_replacement: Optional[str] = "URL省略",
+            code_block_replacement: Optional[str] = "コード省略",
+            sound_emoji_replacement: str = "サウンド文字省略"
+    ) -> bytes:
+        """
+        Replace code blocks, URLs, custom emojis and sound emojis in one scan of UTF-8 text.
+        Gives the same result as replace_urls, replace_code_blocks, replace_custom_emoji
+        and replace_sound_moji applied in that order.
+        :param data: UTF-8 text
+        :param url_replacement: Replacement for URLs, None to keep them
+        :param code_block_replacement: Replacement for code blocks, None to keep them
+        :param sound_emoji_replacement: Replacement for sound emojis
+        :return: Replaced UTF-8 text
+        """
+        if b"<" not in data and b"://" not in data and b"```" not in data:
+            return data
+        pattern, kinds = cls.builtin_pattern(bool(url_replacement), bool(code_block_replacement))
+        replacements = {
+            "code_block": (code_block_replacement or "").encode("utf8"),
+            "url": (url_replacement or "").encode("utf8"),
+            "sound_emoji": sound_emoji_replacement.encode("utf8"),
+        }
+
+        def rewrite(match) -> bytes:
+            kind = kinds[match.lastindex - 1]
+            if kind == "custom_emoji":
+                return match.group(match.lastindex)
+            return replacements[kind]
+
+        return pattern.sub(rewrite, data)
 
     @classmethod
     def replace_urls(cls, text: str, replacement: str) -> str:
@@ -177,10 +399,10 @@ class Replacer:
         return text
 
     def __bool__(self):
-        return bool(self.regex_replacements or self.simple_replacements)
+        return bool(self.regex_replacements_str or self.simple_replacements)
 
     def __len__(self):
-        return len(self.regex_replacements) + len(self.simple_replacements)
+        return len(self.regex_replacements_str) + len(self.simple_replacements)
 
     def __repr__(self):
         return f"Replacer({self.regex_replacements_str}, {self.simple_replacements})"
@@ -468,6 +690,13 @@ class GuildSetting(BaseSetting):
     ignore_users: list[int]
     ignore_roles: list[int]
     read_nick: bool
+    queue_limit: int = 20
+    queue_audio_limit: float = 60.0
+    queue_policy: str = "oldest"
+    queue_keep: int = 5
+    coalesce_ms: int = 0
+    segment_first: int = 20
+    segment_size: int = 80
 
 
 @dataclass
@@ -544,9 +773,17 @@ class ReplacerHolder(BaseDataHolder):
         """
         self.set(id, DictionaryLoader.smart_fetch(id, self.table, True))
 
+    def invalidate(self, id: int) -> None:
+        """
+        Forget the loaded replacer so that the next get loads it from database again.
+        :param id: Discord guild id or user id
+        :return: None
+        """
+        self._replacers.pop(id, None)
+
     def add(self, id: int, before: str, after: str, use_regex: bool = False):
         """
-        Add dictionary to database and load it.
+        Add dictionary to database and to the loaded replacer.
         :param id: Discord guild id or user id
         :param before: Text to be replaced
         :param after: Replacement text
@@ -554,21 +791,27 @@ class ReplacerHolder(BaseDataHolder):
         :return: None
         """
         DictionaryLoader.add_dictionary(id, before, after, use_regex, type=self.table, auto_create=True)
-        self.auto_load(id)
+        replacer = self._replacers.get(id)
+        if replacer is not None:
+            replacer.add(before, after, use_regex)
 
     def delete(self, id: int, before: str) -> None:
         """
-        Delete dictionary from database and load it.
+        Delete dictionary from database and from the loaded replacer.
         :param id: Discord guild id or user id
         :param before: Text to be replaced
         :return: None
         """
         DictionaryLoader.delete_dictionary(id, before, type=self.table)
-        self.auto_load(id)
+        replacer = self._replacers.get(id)
+        if replacer is not None:
+            replacer.remove(before)
 
     def update(self, id: int, old_before: str, new_before: str, after: str, use_regex: bool = False) -> None:
         """
-        Update dictionary in database and load it.
+        Update dictionary in database and in the loaded replacer.
+        The replacer is loaded again only when the entry changes between simple and regex or is not loaded,
+        because the order of regex replacements then depends on the database rows.
         :param id: Discord guild id or user id
         :param old_before: Old text to be replaced
         :param new_before: New text to be replaced
@@ -578,7 +821,9 @@ class ReplacerHolder(BaseDataHolder):
         """
         DictionaryLoader.update_dictionary(
             id, old_before, new_before, after, use_regex, type=self.table, auto_create=True)
-        self.auto_load(id)
+        replacer = self._replacers.get(id)
+        if replacer is not None and not replacer.rename(old_before, new_before, after, use_regex):
+            self.auto_load(id)
 
 
 @dataclass
@@ -669,6 +914,17 @@ class SettingLoader:
     setting database wrapper
     """
     file_path: str | os.PathLike = "../setting.db"
+    # columns added after the first release, appended to existing tables by create_table
+    guild_columns: dict[str, str] = {
+        "queue_limit": "INTEGER NOT NULL DEFAULT 20",
+        "queue_audio_limit": "REAL NOT NULL DEFAULT 60.0",
+        "queue_policy": "TEXT NOT NULL DEFAULT 'oldest'",
+        "queue_keep": "INTEGER NOT NULL DEFAULT 5",
+        "coalesce_ms": "INTEGER NOT NULL DEFAULT 0",
+        "segment_first": "INTEGER NOT NULL DEFAULT 20",
+        "segment_size": "INTEGER NOT NULL DEFAULT 80",
+    }
+    queue_policies: tuple[str, ...] = ("oldest", "newest", "latest")
 
     @classmethod
     def set_db_path(cls, path: str | os.PathLike) -> None:
@@ -700,6 +956,10 @@ class SettingLoader:
                 f" read_length INTEGER , read_nonparticipation INTEGER , read_replyuser INTEGER ,"
                 f"  ignore_users TEXT , ignore_roles TEXT , read_nick INTEGER)"
             )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(guilds)")}
+            for column, definition in cls.guild_columns.items():
+                if column not in columns:
+                    db.execute(f"ALTER TABLE guilds ADD COLUMN {column} {definition}")
             db.commit()
         except sqlite3.OperationalError as e:
             db.rollback()
@@ -0,0 +1,222 @@
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from logging import getLogger
+from typing import Optional
+
+import aiohttp
+import requests
+
+logger = getLogger(__name__)
+
+# failures to reach the engine, read timeouts only mean that the engine is busy
+CONNECTION_ERRORS = (
+    ConnectionError,
+    requests.ConnectionError,
+    aiohttp.ClientConnectorError,
+    aiohttp.ConnectionTimeoutError,
+    aiohttp.ServerDisconnectedError,
+)
+
+
+@dataclass
+class Engine:
+    """
+    VoiceVox Engine endpoint and its statistics
+    """
+    host: str
+    port: int
+    healthy: bool = True
+    in_flight: int = 0
+    requests: int = 0
+    errors: int = 0
+    latency: float = 0.0
+
+    def url(self, path: str) -> str:
+        """
+        Build the url for the path
+        :param path: API path such as "/audio_query"
+        :return: url
+        """
+        return f'http://{self.host}:{self.port}{path}'
+
+    def __str__(self):
+        return f"{self.host}:{self.port}"
+
+
+class EnginePool:
+    """
+    Routes requests to the healthy engine with the fewest outstanding requests.
+    """
+    latency_weight: float = 0.2
+
+    def __init__(self, endpoints: list[tuple[str, int]]) -> None:
+        """
+        Create the pool.
+        :param endpoints: list of (host, port)
+        """
+        self._lock = threading.Lock()
+        self._engines: list[Engine] = [Engine(host, port) for host, port in endpoints]
+        self._checker: Optional[threading.Thread] = None
+        self._checker_stop = threading.Event()
+
+    def set_engines(self, endpoints: list[tuple[str, int]]) -> None:
+        """
+        Replace the engines.
+        :param endpoints: list of (host, port)
+        :return: None
+        """
+        with self._lock:
+            self._engines = [Engine(host, port) for host, port in endpoints]
+
+    def add(self, host: str, port: int, healthy: bool = True) -> Engine:
+        """
+        Add the engine if it is not registered.
+        :param host: Engine host
+        :param port: Engine port
+        :param healthy: Whether to route requests to it before the first health check
+        :return: Engine object
+        """
+        with self._lock:
+            for engine in self._engines:
+                if engine.host == host and engine.port == port:
+                    engine.healthy = healthy
+                    return engine
+            engine = Engine(host, port, healthy)
+            self._engines.append(engine)
+            return engine
+
+    def remove(self, host: str, port: int) -> None:
+        """
+        Remove the engine.
+        :param host: Engine host
+        :param port: Engine port
+        :return: None
+        """
+        with self._lock:
+            self._engines = [e for e in self._engines if not (e.host == host and e.port == port)]
+
+    def mark(self, host: str, port: int, healthy: bool) -> None:
+        """
+        Take the engine in or out of rotation.
+        :param host: Engine host
+        :param port: Engine port
+        :param healthy: New state
+        :return: None
+        """
+        with self._lock:
+            for engine in self._engines:
+                if engine.host == host and engine.port == port:
+                    engine.healthy = healthy
+
+    def _choose(self) -> Engine:
+        candidates = [e for e in self._engines if e.healthy] or self._engines
+        if not candidates:
+            raise RuntimeError("No VoiceVox Engine is registered")
+        return min(candidates, key=lambda e: (e.in_flight, e.latency))
+
+    @contextmanager
+    def acquire(self) -> Iterator[Engine]:
+        """
+        Choose an engine for one request and record its result.
+        If no engine is healthy, every engine is tried.
+        A connection error takes the engine out of rotation until the next health check.
+        Other errors such as read timeouts are only counted.
+        :return: Engine object
+        """
+        with self._lock:
+            engine = self._choose()
+            engine.in_flight += 1
+            engine.requests += 1
+        start = time.perf_counter()
+        try:
+            yield engine
+        except Exception as e:
+            with self._lock:
+                engine.errors += 1
+                if isinstance(e, CONNECTION_ERRORS) and engine.healthy:
+                    engine.healthy = False
+                    logger.warning(f"VoiceVox Engine {engine} is taken out of rotation: {e!r}")
+            raise
+        else:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                if engine.latency:
+                    engine.latency += (elapsed - engine.latency) * self.latency_weight
+                else:
+                    engine.latency = elapsed
+        finally:
+            with self._lock:
+                engine.in_flight -= 1
+
+    @staticmethod
+    def check(engine: Engine, timeout: float = 2.0) -> bool:
+        """
+        Check whether the engine answers /version.
+        :param engine: Engine object
+        :param timeout: Timeout in seconds
+        :return: True if the engine is ready
+        """
+        try:
+            return requests.get(engine.url("/version"), timeout=timeout).ok
+        except requests.RequestException:
+            return False
+
+    def check_all(self) -> None:
+        """
+        Health check every engine and update its state.
+        :return: None
+        """
+        for engine in self.engines():
+            healthy = self.check(engine)
+            if healthy != engine.healthy:
+                logger.info(f"VoiceVox Engine {engine} is {'healthy' if healthy else 'unhealthy'}")
+            self.mark(engine.host, engine.port, healthy)
+
+    def start_health_checks(self, interval: float = 10.0) -> None:
+        """
+        Start the health check thread.
+        :param interval: Seconds between checks
+        :return: None
+        """
+        if self._checker is not None and self._checker.is_alive():
+            return
+        self._checker_stop.clear()
+
+        def loop():
+            while not self._checker_stop.wait(interval):
+                self.check_all()
+
+        self._checker = threading.Thread(target=loop, name="engine-health", daemon=True)
+        self._checker.start()
+
+    def stop_health_checks(self) -> None:
+        """
+        Stop the health check thread.
+        :return: None
+        """
+        self._checker_stop.set()
+
+    def engines(self) -> list[Engine]:
+        """
+        Get the registered engines.
+        :return: list of Engine objects
+        """
+        with self._lock:
+            return list(self._engines)
+
+    def stats(self) -> list[Engine]:
+        """
+        Get a snapshot of each engine's state, in-flight requests and latency.
+        :return: list of Engine copies
+        """
+        with self._lock:
+            return [replace(e) for e in self._engines]
+
+    def __len__(self):
+        return len(self._engines)
+
+    def __repr__(self):
+        return f"EnginePool({', '.join(map(str, self._engines))})"
@@ -1,14 +1,190 @@
+import os
+import shlex
+import threading
+import time
+from dataclasses import dataclass
 from logging import getLogger
-from subprocess import Popen, DEVNULL, PIPE
+from subprocess import Popen, DEVNULL, TimeoutExpired
+from typing import Optional
+
+from vv_wrapper.engine import Engine, EnginePool
 
 logger = getLogger(__name__)
 
-def start_engine(path_arguments: str) -> Popen:
+
+def start_engine(path_arguments: str, host: str = "127.0.0.1", port: int = 50021, timeout: float = 120.0) -> Popen:
+    """
+    Start one engine and wait until it answers the HTTP health check.
+    :param path_arguments: Command line of the engine
+    :param host: Host the engine listens on
+    :param port: Port the engine listens on
+    :param timeout: Seconds to wait for the engine
+    :return: Engine process
+    :raises RuntimeError: The engine exited or did not become ready in time
+    """
     logger.info(f"Starting VoiceVox engine with {path_arguments}")
-    process = Popen(path_arguments, shell=True, stdout=PIPE, stderr=DEVNULL, text=True)
-    while True:
-        output = process.stdout.readline()
-        if "100%" in output:
-            break
+    process = Popen(path_arguments, shell=True, stdout=DEVNULL, stderr=DEVNULL)
+    deadline = time.monotonic() + timeout
+    engine = Engine(host, port)
+    while not EnginePool.check(engine):
+        if process.poll() is not None:
+            raise RuntimeError(f"VoiceVox engine exited with code {process.returncode}")
+        if time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"VoiceVox engine did not become ready in {timeout}s")
+        time.sleep(0.5)
     logger.info("VoiceVox engine started")
     return process
+
+
+@dataclass
+class EngineProcess:
+    """
+    Supervised engine process
+    """
+    port: int
+    process: Optional[Popen] = None
+    ready: bool = False
+    restarts: int = 0
+    started_at: float = 0.0
+    next_start: float = 0.0
+
+
+class EngineSupervisor:
+    """
+    Launches engines on consecutive ports, marks them ready by HTTP health checks,
+    restarts crashed engines with backoff and registers them with the engine pool.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            args: str = "",
+            count: int = 1,
+            host: str = "127.0.0.1",
+            base_port: int = 50021,
+            cpu_num_threads: Optional[int] = None,
+            pool: Optional[EnginePool] = None,
+            ready_timeout: float = 120.0,
+            check_interval: float = 2.0,
+            max_backoff: float = 60.0
+    ) -> None:
+        """
+        Set up the supervisor.
+        :param path: Path of the engine executable
+        :param args: Extra command line arguments
+        :param count: Number of engine processes
+        :param host: Host the engines listen on
+        :param base_port: Port of the first engine, the others use the following ports
+        :param cpu_num_threads: Threads per engine passed as --cpu_num_threads, None to use the engine default
+        :param pool: Engine pool to register the engines with
+        :param ready_timeout: Seconds an engine may take to become ready before it is restarted
+        :param check_interval: Seconds between process and readiness checks
+        :param max_backoff: Maximum seconds to wait before restarting a crashed engine
+        """
+        self.path: str = path
+        self.args: list[str] = shlex.split(args, posix=os.name != "nt")
+        self.host: str = host
+        self.cpu_num_threads: Optional[int] = cpu_num_threads
+        self.pool: Optional[EnginePool] = pool
+        self.ready_timeout: float = ready_timeout
+        self.check_interval: float = check_interval
+        self.max_backoff: float = max_backoff
+        self.engines: list[EngineProcess] = [EngineProcess(base_port + i) for i in range(count)]
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def command(self, port: int) -> list[str]:
+        """
+        Command line for the engine on the port
+        :param port: Port of the engine
+        :return: argument list
+        """
+        command = [self.path, *self.args, "--host", self.host, "--port", str(port)]
+        if self.cpu_num_threads:
+            command += ["--cpu_num_threads", str(self.cpu_num_threads)]
+        return command
+
+    def start(self, wait: bool = True) -> None:
+        """
+        Launch every engine and start monitoring them.
+        :param wait: Whether to block until every engine is ready or ready_timeout passes
+        :return: None
+        """
+        self._stop.clear()
+        for engine in self.engines:
+            self._launch(engine)
+        self._monitor = threading.Thread(target=self._run, name="engine-supervisor", daemon=True)
+        self._monitor.start()
+        if wait:
+            deadline = time.monotonic() + self.ready_timeout
+            while not all(e.ready for e in self.engines) and time.monotonic() < deadline:
+                time.sleep(0.5)
+            ready = sum(e.ready for e in self.engines)
+            if ready < len(self.engines):
+                logger.warning(f"{ready}/{len(self.engines)} VoiceVox engines are ready")
+            else:
+                logger.info(f"{ready} VoiceVox engines are ready")
+
+    def stop(self) -> None:
+        """
+        Stop monitoring and terminate every engine.
+        :return: None
+        """
+        self._stop.set()
+        for engine in self.engines:
+            if self.pool is not None:
+                self.pool.mark(self.host, engine.port, False)
+            if engine.process is not None and engine.process.poll() is None:
+                engine.process.terminate()
+        for engine in self.engines:
+            if engine.process is not None:
+                try:
+                    engine.process.wait(timeout=10)
+                except TimeoutExpired:
+                    engine.process.kill()
+
+    def _launch(self, engine: EngineProcess) -> None:
+        logger.info(f"Starting VoiceVox engine on port {engine.port}")
+        engine.process = Popen(self.command(engine.port), stdout=DEVNULL, stderr=DEVNULL)
+        engine.ready = False
+        engine.started_at = time.monotonic()
+        if self.pool is not None:
+            self.pool.add(self.host, engine.port, healthy=False)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            for engine in self.engines:
+                self._check(engine)
+
+    def _check(self, engine: EngineProcess) -> None:
+        now = time.monotonic()
+        if engine.process is None:
+            if now >= engine.next_start:
+                self._launch(engine)
+            return
+        if engine.process.poll() is not None:
+            self._crashed(engine, f"exited with code {engine.process.returncode}")
+            return
+        healthy = EnginePool.check(Engine(self.host, engine.port))
+        if healthy and not engine.ready:
+            logger.info(f"VoiceVox engine on port {engine.port} is ready")
+            engine.ready = True
+            if self.pool is not None:
+                self.pool.mark(self.host, engine.port, True)
+        elif not engine.ready and now - engine.started_at > self.ready_timeout:
+            engine.process.kill()
+            self._crashed(engine, f"did not become ready in {self.ready_timeout}s")
+
+    def _crashed(self, engine: EngineProcess, reason: str) -> None:
+        if engine.ready and time.monotonic() - engine.started_at > self.max_backoff:
+            # ran long enough to count as recovered
+            engine.restarts = 0
+        backoff = min(2 ** engine.restarts, self.max_backoff)
+        logger.warning(f"VoiceVox engine on port {engine.port} {reason}, restarting in {backoff}s")
+        if self.pool is not None:
+            self.pool.mark(self.host, engine.port, False)
+        engine.process = None
+        engine.ready = False
+        engine.restarts += 1
+        engine.next_start = time.monotonic() + backoff